@@ -7,6 +7,8 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_talisman import Talisman
 from werkzeug.middleware.proxy_fix import ProxyFix
+from app.cache import PageCache, ValueCache
+from app.jobs import BackgroundJobs
 import os
 import logging
 from logging.handlers import RotatingFileHandler
@@ -21,6 +23,9 @@ limiter = Limiter(
     default_limits=["200 per day", "50 per hour"],
     storage_uri="memory://"
 )
+page_cache = PageCache()
+active_campaign_cache = ValueCache('ACTIVE_CAMPAIGN_TTL')
+report_jobs = BackgroundJobs('REPORT_WORKERS')
 
 def create_app(config_name=None):
     app = Flask(__name__)
@@ -50,9 +55,21 @@ def create_app(config_name=None):
     csrf.init_app(app)
     migrate.init_app(app, db)
     limiter.init_app(app)
+    page_cache.init_app(app)
+    active_campaign_cache.init_app(app)
+    report_jobs.init_app(app)
     
     # Configure Talisman for security headers (only in production behind Traefik)
     if app.config['ENV'] == 'production':
+        # Registered before Talisman so it runs after it. A 304 keeps the cached
+        # body, which carries the old CSP nonce - sending a fresh policy with it
+        # would make the browser block that page's scripts.
+        @app.after_request
+        def keep_cached_csp_on_not_modified(response):
+            if response.status_code == 304:
+                response.headers.pop('Content-Security-Policy', None)
+            return response
+        
         Talisman(
             app,
             force_https=False,  # Traefik handles TLS termination
@@ -124,6 +141,9 @@ def create_app(config_name=None):
     app.register_blueprint(main_blueprint)
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
     
+    from app.commands import register_commands
+    register_commands(app)
+    
     return app
 
 
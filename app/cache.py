@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class PageCache:
+    """
+    Size-bounded, thread-safe LRU cache for rendered public pages.
+
+    Keys are expected to carry the campaign revision, so an entry never has
+    to be invalidated: once a manager changes the campaign the key changes
+    and the stale entry simply ages out of the LRU.
+    """
+
+    def __init__(self, app=None, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('PAGE_CACHE_SIZE', self.max_entries)
+        self.clear()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key, render):
+        """Return the cached value for key, calling render() to fill it on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ValueCache:
+    """
+    Process-local cache for a single value that rarely changes.
+
+    The value is kept for a TTL read from the app config and can be dropped
+    explicitly with invalidate(). A load that races with an invalidation is
+    not stored, so an invalidation is never undone by a slow reader.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, ttl_config_key, ttl=60):
+        self.ttl_config_key = ttl_config_key
+        self.ttl = ttl
+        self._value = self._MISSING
+        self._expires_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get(self.ttl_config_key, self.ttl)
+        self.invalidate()
+
+    def get_or_load(self, load):
+        with self._lock:
+            if self._value is not self._MISSING and time.monotonic() < self._expires_at:
+                return self._value
+            generation = self._generation
+        value = load()
+        with self._lock:
+            if generation == self._generation:
+                self._value = value
+                self._expires_at = time.monotonic() + self.ttl
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = self._MISSING
+            self._generation += 1
@@ -0,0 +1,63 @@
+import click
+
+from app import db
+from app.models import Asset, Campaign, normalize_asset_name
+from app.reports import index_report_files
+from app.rollups import rebuild_rollups
+
+
+def register_commands(app):
+    """Register the maintenance commands run with `flask <command>`."""
+
+    @app.cli.command('index-reports')
+    def index_reports():
+        """Index report files in REPORTS_DIR that are missing from the report archive."""
+        count = index_report_files(app.config['REPORTS_DIR'], compress=app.config['REPORTS_GZIP'])
+        click.echo(f'Indexed {count} report file(s).')
+
+    @app.cli.command('rebuild-rollups')
+    @click.option('--campaign', 'campaign_id', type=int, help='Only rebuild this campaign.')
+    @click.option('--check', is_flag=True, help='Only report drift, do not write.')
+    def rebuild_rollups_command(campaign_id, check):
+        """Recompute the campaign rollups from the raw rows and report any drift."""
+        campaign_ids = [campaign_id] if campaign_id else [
+            campaign_id for (campaign_id,) in db.session.query(Campaign.id).order_by(Campaign.id)
+        ]
+        drifted = 0
+        for campaign_id in campaign_ids:
+            differences = rebuild_rollups(campaign_id)
+            for table, key, field, stored, actual in differences:
+                click.echo(f'Campaign {campaign_id}: {table}[{key}].{field} was {stored}, should be {actual}')
+            drifted += bool(differences)
+        if check:
+            db.session.rollback()
+        else:
+            db.session.commit()
+        click.echo(f'{"Checked" if check else "Rebuilt"} {len(campaign_ids)} campaign(s), {drifted} had drifted.')
+        if check and drifted:
+            raise SystemExit(1)
+
+    @app.cli.command('backfill-name-keys')
+    def backfill_name_keys():
+        """Set asset.name_key from normalize_asset_name and list the names that clash within a library."""
+        names, stale = {}, []
+        for asset_id, library_id, name, name_key in db.session.query(
+            Asset.id, Asset.library_id, Asset.name, Asset.name_key
+        ).order_by(Asset.id):
+            key = normalize_asset_name(name)
+            names.setdefault((library_id, key), []).append(name)
+            if name_key != key:
+                stale.append({'asset_id': asset_id, 'key': key})
+        clashes = [(library_id, key, clashing) for (library_id, key), clashing in names.items() if len(clashing) > 1]
+        for library_id, key, clashing in clashes:
+            click.echo(f'Library {library_id}: {", ".join(clashing)} share the name key "{key}"')
+        if stale and not clashes:
+            asset_table = Asset.__table__
+            db.session.execute(
+                asset_table.update().where(asset_table.c.id == db.bindparam('asset_id')).values(name_key=db.bindparam('key')),
+                stale
+            )
+            db.session.commit()
+        click.echo(f'Updated {0 if clashes else len(stale)} name key(s), {len(clashes)} clash(es) to resolve.')
+        if clashes:
+            raise SystemExit(1)
@@ -42,6 +42,16 @@ class Config:
     
     # Application settings
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB default
+    PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 256))  # Rendered public pages kept in memory
+    ACTIVE_CAMPAIGN_TTL = int(os.environ.get('ACTIVE_CAMPAIGN_TTL', 60))  # Seconds the active campaign lookup is cached per process
+    TIMELINE_PAGE_SIZE = int(os.environ.get('TIMELINE_PAGE_SIZE', 50))  # Events per timeline page
+    RECENT_EVENTS_LIMIT = int(os.environ.get('RECENT_EVENTS_LIMIT', 10))  # Events in the manager dashboard's recent events widget
+    ASSET_CHANGE_BATCH_LIMIT = int(os.environ.get('ASSET_CHANGE_BATCH_LIMIT', 1000))  # Asset changes accepted per batch request
+    ASSET_UPLOAD_BATCH_SIZE = int(os.environ.get('ASSET_UPLOAD_BATCH_SIZE', 500))  # Rows upserted per transaction in library uploads
+    REPORTS_DIR = os.environ.get('REPORTS_DIR', '/app/reports')  # Where final campaign reports are archived
+    REPORTS_GZIP = os.environ.get('REPORTS_GZIP', 'True').lower() == 'true'  # Store archived reports gzip-compressed
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 1))  # Background threads writing final reports
+    REPORTS_PAGE_SIZE = int(os.environ.get('REPORTS_PAGE_SIZE', 50))  # Archived reports listed per dashboard page
     
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
@@ -82,8 +92,10 @@ class TestingConfig(Config):
     TESTING = True
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # SQLite does not accept the pool sizing options
     WTF_CSRF_ENABLED = False
     SESSION_COOKIE_SECURE = False
+    RATELIMIT_ENABLED = False
 
 
 # Configuration dictionary
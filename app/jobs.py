@@ -0,0 +1,76 @@
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundJobs:
+    """
+    Small in-process job queue for work that should not hold up a request.
+
+    Jobs run on a thread pool inside an application context and their status
+    is kept in memory so a page can poll it. The table only covers the
+    current process, which is all waitress runs; the oldest finished jobs are
+    forgotten once more than max_jobs are tracked.
+    """
+
+    def __init__(self, workers_config_key, workers=1, max_jobs=200):
+        self.workers_config_key = workers_config_key
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.app = None
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get(self.workers_config_key, self.workers)
+        with self._lock:
+            self._jobs.clear()
+
+    def submit(self, func, *args, **info):
+        """Queue func(*args) and return the job id; info is reported with the job status."""
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'status': 'queued', 'error': None, **info}
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            self._jobs[job_id] = job
+            self._forget_finished()
+            job['future'] = self._executor.submit(self._run, self.app, job, func, args)
+        return job_id
+
+    def _run(self, app, job, func, args):
+        job['status'] = 'running'
+        with app.app_context():
+            try:
+                func(*args)
+            except Exception as e:
+                app.logger.error(f'Background job {job["id"]} failed: {traceback.format_exc()}')
+                job['error'] = str(e)
+                job['status'] = 'failed'
+            else:
+                job['status'] = 'done'
+
+    def _forget_finished(self):
+        for job_id in [job_id for job_id, job in self._jobs.items() if job['status'] in ('done', 'failed')]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+
+    def status(self, job_id):
+        """Return the job's public status dict, or None if it is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {key: value for key, value in job.items() if key != 'future'}
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job has finished and return its status."""
+        with self._lock:
+            future = self._jobs[job_id]['future']
+        future.result(timeout)
+        return self.status(job_id)
@@ -1,8 +1,15 @@
 from app import db, login_manager
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 
+
+def normalize_asset_name(name):
+    """Key used to spot duplicate asset names: case-insensitive, whitespace collapsed."""
+    return ' '.join((name or '').split()).casefold()
+
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -43,20 +50,48 @@ class AssetLibrary(db.Model):
 
 class Asset(db.Model):
     """Individual asset within a library"""
+    __table_args__ = (
+        db.Index('ix_asset_library_updated', 'library_id', 'updated_at'),  # Incremental library sync
+        # One asset per name in a library, ignoring case and spacing
+        db.UniqueConstraint('library_id', 'name_key', name='uq_asset_library_name_key'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
-    library_id = db.Column(db.Integer, db.ForeignKey('asset_library.id'), nullable=False)
+    library_id = db.Column(db.Integer, db.ForeignKey('asset_library.id'), nullable=False)  # Led by the indexes above
     name = db.Column(db.String(200), nullable=False)
+    name_key = db.Column(db.String(200), nullable=False)  # normalize_asset_name(name), kept in sync by set_name_key
     type = db.Column(db.String(50), nullable=False)  # Vehicle, Weapon, Equipment, etc.
     category = db.Column(db.String(50))  # Subcategory like "Ground Vehicle", "Assault Rifle"
     description = db.Column(db.Text)
     default_quantity = db.Column(db.Integer, default=1)  # Default quantity when imported
+    quantity_updated_at = db.Column(db.DateTime)  # Last change to default_quantity, kept by track_quantity_change
     is_unique = db.Column(db.Boolean, default=False)
     show_in_public = db.Column(db.Boolean, default=True)  # Show this asset in public view
+    retired_at = db.Column(db.DateTime)  # Removed from the library while still in campaign pools
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @validates('name')
+    def set_name_key(self, key, name):
+        self.name_key = normalize_asset_name(name)
+        return name
+    
+    @validates('default_quantity')
+    def track_quantity_change(self, key, quantity):
+        # Library sync only propagates quantities that changed since an import's watermark
+        if self.default_quantity != quantity:
+            self.quantity_updated_at = datetime.utcnow()
+        return quantity
 
 
 class Campaign(db.Model):
+    __table_args__ = (
+        # Every page resolves the active campaign; only one row ever matches
+        db.Index('ix_campaign_active', 'id',
+                 postgresql_where=db.text('is_active AND NOT is_closed'),
+                 sqlite_where=db.text('is_active = 1 AND is_closed = 0')),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -66,7 +101,9 @@ class Campaign(db.Model):
     is_closed = db.Column(db.Boolean, default=False)
     map_edit_url = db.Column(db.String(500))  # Editorial link for admins/managers
     map_view_url = db.Column(db.String(500))  # View link for public
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every change to campaign data
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Last change to campaign data
     
     # Relationships
     imported_libraries = db.relationship('CampaignLibraryImport', backref='campaign', lazy=True, cascade='all, delete-orphan')
@@ -76,11 +113,17 @@ class Campaign(db.Model):
 
 class CampaignLibraryImport(db.Model):
     """Track which libraries are imported into a campaign"""
+    __table_args__ = (
+        db.UniqueConstraint('campaign_id', 'library_id', name='uq_campaign_library_import'),
+        db.Index('ix_campaign_library_import_library', 'library_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)
     library_id = db.Column(db.Integer, db.ForeignKey('asset_library.id'), nullable=False)
     imported_at = db.Column(db.DateTime, default=datetime.utcnow)
-    last_synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_synced_at = db.Column(db.DateTime, default=datetime.utcnow)  # Watermark for incremental sync
+    removal_policy = db.Column(db.String(20), nullable=False, default='flag', server_default='flag')  # flag or remove retired assets
     
     # Relationship
     library = db.relationship('AssetLibrary', backref='campaign_imports')
@@ -88,6 +131,13 @@ class CampaignLibraryImport(db.Model):
 
 class CampaignAsset(db.Model):
     """Assets available in a campaign's pool (from imported libraries)"""
+    __table_args__ = (
+        # Routes look pool entries up by (campaign_id, asset_id) and assume at most one
+        db.UniqueConstraint('campaign_id', 'asset_id', name='uq_campaign_asset'),
+        db.Index('ix_campaign_asset_campaign_library', 'campaign_id', 'library_id'),
+        db.Index('ix_campaign_asset_asset', 'asset_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)
     asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'), nullable=False)
@@ -101,6 +151,11 @@ class CampaignAsset(db.Model):
 
 
 class Mission(db.Model):
+    __table_args__ = (
+        db.Index('ix_mission_campaign_order', 'campaign_id', 'order_index'),
+        db.Index('ix_mission_campaign_date', 'campaign_id', 'mission_date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)
     name = db.Column(db.String(200), nullable=False)
@@ -118,6 +173,11 @@ class Mission(db.Model):
 
 
 class Event(db.Model):
+    __table_args__ = (
+        db.Index('ix_event_mission_date', 'mission_id', 'event_date'),
+        db.Index('ix_event_date', 'event_date', 'id'),  # Timeline keyset order
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     mission_id = db.Column(db.Integer, db.ForeignKey('mission.id'), nullable=False)
     event_type = db.Column(db.String(50), nullable=False)  # combat, logistics, training, other
@@ -133,6 +193,11 @@ class Event(db.Model):
 
 
 class AssetChange(db.Model):
+    __table_args__ = (
+        db.Index('ix_asset_change_event', 'event_id'),
+        db.Index('ix_asset_change_asset', 'asset_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'))
     asset_id = db.Column(db.Integer, db.ForeignKey('asset.id', ondelete='CASCADE'))
@@ -143,9 +208,99 @@ class AssetChange(db.Model):
     asset = db.relationship('Asset', backref='asset_changes')
 
 
+class InventorySnapshot(db.Model):
+    """
+    Net ledger position of a campaign's pool at a point in time.
+
+    Covers every asset change whose event is dated before as_of. Items store the
+    summed quantity_change per asset rather than absolute quantities, so later
+    edits to initial quantities do not make a snapshot stale.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('campaign_id', 'as_of', name='uq_inventory_snapshot_campaign_as_of'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False)
+    change_count = db.Column(db.Integer, nullable=False, default=0)  # Ledger rows folded into the snapshot
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    items = db.relationship('InventorySnapshotItem', backref='snapshot', lazy=True, cascade='all, delete-orphan')
+
+
+class InventorySnapshotItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('inventory_snapshot.id', ondelete='CASCADE'), nullable=False, index=True)
+    asset_id = db.Column(db.Integer, db.ForeignKey('asset.id', ondelete='CASCADE'), nullable=False)
+    net_change = db.Column(db.Integer, nullable=False)
+
+
+class CampaignRollup(db.Model):
+    """
+    Running totals of a campaign for the dashboards and reports.
+
+    Ledger figures are adjusted in the same transaction as each event or asset
+    change write; pool figures are recounted whenever pool quantities change.
+    A campaign without a row has no valid rollup yet and is rebuilt from the
+    raw rows when next read (see app/rollups.py).
+    """
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id', ondelete='CASCADE'), primary_key=True)
+    asset_count = db.Column(db.Integer, nullable=False, default=0)
+    low_stock_count = db.Column(db.Integer, nullable=False, default=0)
+    depleted_count = db.Column(db.Integer, nullable=False, default=0)
+    total_initial = db.Column(db.Integer, nullable=False, default=0)
+    total_current = db.Column(db.Integer, nullable=False, default=0)
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+    change_count = db.Column(db.Integer, nullable=False, default=0)
+    gains = db.Column(db.Integer, nullable=False, default=0)  # Sum of positive quantity changes
+    losses = db.Column(db.Integer, nullable=False, default=0)  # Sum of negative quantity changes, as a positive number
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class MissionRollup(db.Model):
+    """Running ledger totals of one mission; a missing row means all zero."""
+    mission_id = db.Column(db.Integer, db.ForeignKey('mission.id', ondelete='CASCADE'), primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id', ondelete='CASCADE'), nullable=False, index=True)
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+    change_count = db.Column(db.Integer, nullable=False, default=0)
+    gains = db.Column(db.Integer, nullable=False, default=0)
+    losses = db.Column(db.Integer, nullable=False, default=0)
+
+
+class EventTypeRollup(db.Model):
+    """Number of events of one type in a campaign; a missing row means none."""
+    __table_args__ = (
+        db.UniqueConstraint('campaign_id', 'event_type', name='uq_event_type_rollup_campaign_type'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id', ondelete='CASCADE'), nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ReportArchive(db.Model):
+    """
+    Index entry for a final report stored in the reports directory.
+
+    Lets the reports dashboard list archived reports without touching the
+    filesystem. sha256 is taken over the stored bytes (after compression)
+    and doubles as the download ETag.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), index=True)  # Null for files it could not be read from
+    filename = db.Column(db.String(255), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    size = db.Column(db.BigInteger, nullable=False)  # Stored bytes
+    sha256 = db.Column(db.String(64), nullable=False)
+    compressed = db.Column(db.Boolean, nullable=False, default=False)
+
+
 class Log(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'))
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     action = db.Column(db.String(200), nullable=False)
     details = db.Column(db.Text)
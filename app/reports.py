@@ -0,0 +1,398 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import datetime
+from itertools import chain, groupby
+from types import GeneratorType
+
+from flask import current_app
+
+from app import db
+from app.models import Asset, AssetChange, Campaign, CampaignAsset, Event, Log, Mission, ReportArchive
+from app.rollups import event_type_counts, load_campaign_rollup
+
+STREAM_BATCH_SIZE = 500  # Rows fetched per round trip while streaming a report
+STREAM_CHUNK_SIZE = 64 * 1024  # Characters sent per chunk of a streamed report
+REPORT_FILENAME = re.compile(r'campaign_(\d+)_')
+MISSION_STATUSES = ['completed', 'in_progress', 'planned', 'cancelled']
+
+
+class CsvLines:
+    """Format rows as CSV text one line at a time, for streamed responses."""
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def __call__(self, row):
+        self._writer.writerow(row)
+        line = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return line
+
+
+def iter_pool_csv(campaign_id):
+    """Yield the campaign's asset pool report as CSV lines from a single joined query."""
+    line = CsvLines()
+    yield line(['Asset Name', 'Asset Type', 'Initial Quantity', 'Current Quantity', 'Net Change'])
+
+    rows = db.session.query(
+        Asset.name, Asset.type, CampaignAsset.initial_quantity, CampaignAsset.current_quantity
+    ).join(Asset, CampaignAsset.asset_id == Asset.id).filter(
+        CampaignAsset.campaign_id == campaign_id
+    ).order_by(CampaignAsset.id).yield_per(STREAM_BATCH_SIZE)
+
+    for name, asset_type, initial_quantity, current_quantity in rows:
+        yield line([name, asset_type, initial_quantity, current_quantity, current_quantity - initial_quantity])
+
+
+def iter_ledger_csv(campaign_id):
+    """Yield every asset change of the campaign as CSV lines, in event order."""
+    line = CsvLines()
+    yield line(['Event Date', 'Mission', 'Mission Date', 'Event', 'Event Type',
+                'Asset Name', 'Asset Type', 'Quantity Change', 'Notes'])
+
+    rows = db.session.query(
+        Event.event_date, Mission.name, Mission.mission_date, Event.title, Event.event_type,
+        Asset.name, Asset.type, AssetChange.quantity_change, AssetChange.notes
+    ).select_from(AssetChange).join(Event, AssetChange.event_id == Event.id).join(
+        Mission, Event.mission_id == Mission.id
+    ).join(Asset, AssetChange.asset_id == Asset.id).filter(
+        Mission.campaign_id == campaign_id
+    ).order_by(Event.event_date, Event.id, AssetChange.id).yield_per(STREAM_BATCH_SIZE)
+
+    for event_date, mission_name, mission_date, title, event_type, asset_name, asset_type, change, notes in rows:
+        yield line([
+            event_date.isoformat(sep=' ', timespec='minutes'),
+            mission_name,
+            mission_date.isoformat() if mission_date else '',
+            title,
+            event_type,
+            asset_name,
+            asset_type,
+            change,
+            notes or ''
+        ])
+
+
+def iter_json(value, indent=2, level=0):
+    """
+    Encode value as JSON text in pieces, formatted exactly like json.dumps(value, indent=indent).
+
+    Generators inside value are encoded as arrays and consumed one item at a
+    time, in document order, so only the item being written is held in memory.
+    """
+    if isinstance(value, GeneratorType):
+        opened = False
+        for item in value:
+            yield ',\n' if opened else '[\n'
+            opened = True
+            yield ' ' * (indent * (level + 1))
+            yield from iter_json(item, indent, level + 1)
+        yield '\n' + ' ' * (indent * level) + ']' if opened else '[]'
+    elif isinstance(value, dict) and any(isinstance(item, (dict, GeneratorType)) for item in value.values()):
+        for i, (key, item) in enumerate(value.items()):
+            yield (',\n' if i else '{\n') + ' ' * (indent * (level + 1)) + _encode_scalar(key) + ': '
+            yield from iter_json(item, indent, level + 1)
+        yield '\n' + ' ' * (indent * level) + '}'
+    else:
+        yield _encode_value(value, indent, level)
+
+
+_encode_scalar = json.JSONEncoder().encode
+
+
+def _encode_value(value, indent, level):
+    if isinstance(value, dict):
+        if not value:
+            return '{}'
+        pad = '\n' + ' ' * (indent * (level + 1))
+        return '{' + ','.join(pad + _encode_scalar(str(key)) + ': ' + _encode_value(item, indent, level + 1)
+                              for key, item in value.items()) + '\n' + ' ' * (indent * level) + '}'
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return '[]'
+        pad = '\n' + ' ' * (indent * (level + 1))
+        return '[' + ','.join(pad + _encode_value(item, indent, level + 1)
+                              for item in value) + '\n' + ' ' * (indent * level) + ']'
+    return _encode_scalar(value)
+
+
+def iter_chunks(pieces, size=STREAM_CHUNK_SIZE):
+    """Join small text pieces into chunks of about size characters before they are sent."""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def generate_final_report(campaign):
+    """
+    Build the final campaign report for archiving.
+
+    Lists are returned as generators over ordered queries and must be consumed
+    in document order, as iter_json does.
+    """
+    return {
+        'campaign': {
+            'name': campaign.name,
+            'description': campaign.description,
+            'start_date': campaign.start_date.isoformat() if campaign.start_date else None,
+            'end_date': campaign.end_date.isoformat() if campaign.end_date else None,
+            'is_closed': campaign.is_closed
+        },
+        'missions_count': Mission.query.filter_by(campaign_id=campaign.id).count(),
+        'asset_history': _iter_asset_history(campaign.id),
+        'detailed_missions': _iter_detailed_missions(campaign.id),
+        'logs': _iter_logs(campaign.id)
+    }
+
+
+def _iter_asset_history(campaign_id):
+    rows = db.session.query(
+        Asset.name, Asset.type, CampaignAsset.initial_quantity, CampaignAsset.current_quantity
+    ).join(Asset, CampaignAsset.asset_id == Asset.id).filter(
+        CampaignAsset.campaign_id == campaign_id
+    ).order_by(CampaignAsset.id).yield_per(STREAM_BATCH_SIZE)
+
+    for name, asset_type, initial_quantity, current_quantity in rows:
+        yield {
+            'asset_name': name,
+            'asset_type': asset_type,
+            'initial_quantity': initial_quantity,
+            'current_quantity': current_quantity,
+            'net_change': current_quantity - initial_quantity
+        }
+
+
+def _iter_detailed_missions(campaign_id):
+    # One row per asset change, outer joined so missions without events and
+    # events without changes still appear; rows are grouped back into the tree.
+    rows = db.session.query(
+        Mission.id.label('mission_id'), Mission.name.label('mission_name'), Mission.mission_date,
+        Mission.description.label('mission_description'),
+        Event.id.label('event_id'), Event.event_type, Event.description.label('event_description'),
+        Event.event_date, Event.notes.label('event_notes'),
+        AssetChange.id.label('change_id'), Asset.name.label('asset_name'), AssetChange.quantity_change,
+        AssetChange.notes.label('change_notes')
+    ).select_from(Mission).outerjoin(Event, Event.mission_id == Mission.id).outerjoin(
+        AssetChange, AssetChange.event_id == Event.id
+    ).outerjoin(Asset, AssetChange.asset_id == Asset.id).filter(
+        Mission.campaign_id == campaign_id
+    ).order_by(Mission.id, Event.id, AssetChange.id).yield_per(STREAM_BATCH_SIZE)
+
+    for _, mission_rows in groupby(rows, key=lambda row: row.mission_id):
+        first = next(mission_rows)
+        yield {
+            'name': first.mission_name,
+            'date': first.mission_date.isoformat() if first.mission_date else None,
+            'description': first.mission_description,
+            'events': _iter_events(chain([first], mission_rows))
+        }
+
+
+def _iter_events(rows):
+    for event_id, event_rows in groupby(rows, key=lambda row: row.event_id):
+        if event_id is None:
+            continue
+        first = next(event_rows)
+        yield {
+            'type': first.event_type,
+            'description': first.event_description,
+            'date': first.event_date.isoformat(),
+            'notes': first.event_notes,
+            'asset_changes': ({
+                'asset_name': row.asset_name,
+                'quantity_change': row.quantity_change,
+                'notes': row.change_notes
+            } for row in chain([first], event_rows) if row.change_id is not None)
+        }
+
+
+def _iter_logs(campaign_id):
+    rows = db.session.query(Log.action, Log.details, Log.created_at).filter(
+        Log.campaign_id == campaign_id
+    ).order_by(Log.id).yield_per(STREAM_BATCH_SIZE)
+
+    for action, details, created_at in rows:
+        yield {
+            'action': action,
+            'details': details,
+            'created_at': created_at.isoformat() if created_at else None
+        }
+
+
+def campaign_statistics(campaign_id):
+    """
+    Gather the summary figures of the campaign report page.
+
+    Totals and event counts come from the campaign rollup; the per-type pool
+    quantities and mission status counts from two GROUP BY queries.
+    """
+    rollup = load_campaign_rollup(campaign_id)
+
+    asset_types = {}
+    for asset_type, count, initial, current in db.session.query(
+        Asset.type, db.func.count(CampaignAsset.id),
+        db.func.sum(CampaignAsset.initial_quantity), db.func.sum(CampaignAsset.current_quantity)
+    ).join(Asset, CampaignAsset.asset_id == Asset.id).filter(
+        CampaignAsset.campaign_id == campaign_id
+    ).group_by(Asset.type).order_by(db.func.min(CampaignAsset.id)):
+        asset_types[asset_type] = {'count': count, 'initial': initial, 'current': current}
+
+    mission_stats = dict.fromkeys(MISSION_STATUSES, 0)
+    mission_stats.update(db.session.query(Mission.status, db.func.count(Mission.id)).filter(
+        Mission.campaign_id == campaign_id
+    ).group_by(Mission.status).all())
+    mission_stats['total'] = sum(mission_stats.values())
+
+    return {
+        'total_assets': rollup.asset_count,
+        'total_initial': rollup.total_initial,
+        'total_current': rollup.total_current,
+        'total_change': rollup.total_current - rollup.total_initial,
+        'asset_types': asset_types,
+        'mission_stats': mission_stats,
+        'total_events': rollup.event_count,
+        'event_types': event_type_counts(campaign_id),
+        'total_asset_changes': rollup.change_count
+    }
+
+
+def write_final_report(campaign_id, path, compress=False):
+    """
+    Write the final report of a campaign to path, gzip-compressed if asked.
+
+    Returns the size and sha256 of the stored file.
+    """
+    campaign = db.session.get(Campaign, campaign_id)
+    if campaign is None:
+        raise ValueError(f'Campaign {campaign_id} not found')
+
+    chunks = (chunk.encode('utf-8') for chunk in iter_chunks(iter_json(generate_final_report(campaign))))
+    return _write_file(path, chunks, compress)
+
+
+def archive_final_report(campaign_id, filename):
+    """Write a campaign's final report into the reports directory and index it."""
+    compress = filename.endswith('.gz')
+    size, digest = write_final_report(campaign_id, os.path.join(current_app.config['REPORTS_DIR'], filename), compress)
+    db.session.add(ReportArchive(campaign_id=campaign_id, filename=filename, size=size, sha256=digest,
+                                 compressed=compress))
+    db.session.commit()
+
+
+def index_report_files(reports_dir, compress=True):
+    """
+    Add report files found in reports_dir that are not indexed yet to the archive.
+
+    Plain .json reports are gzip-compressed first when compress is set.
+    Returns the number of files indexed.
+    """
+    if not os.path.isdir(reports_dir):
+        return 0
+    indexed = {filename for (filename,) in db.session.query(ReportArchive.filename)}
+    campaign_ids = {campaign_id for (campaign_id,) in db.session.query(Campaign.id)}
+
+    count = 0
+    for filename in sorted(os.listdir(reports_dir)):
+        if filename in indexed or not filename.endswith(('.json', '.json.gz')):
+            continue
+        path = os.path.join(reports_dir, filename)
+        created_at = datetime.utcfromtimestamp(os.stat(path).st_mtime)
+        if filename.endswith('.json') and compress:
+            if filename + '.gz' in indexed or os.path.exists(path + '.gz'):
+                continue
+            size, digest = _write_file(path + '.gz', _iter_file(path), compress=True)
+            os.unlink(path)
+            filename += '.gz'
+        else:
+            sha256 = hashlib.sha256()
+            for chunk in _iter_file(path):
+                sha256.update(chunk)
+            size, digest = os.path.getsize(path), sha256.hexdigest()
+
+        match = REPORT_FILENAME.match(filename)
+        campaign_id = int(match.group(1)) if match else None
+        db.session.add(ReportArchive(
+            campaign_id=campaign_id if campaign_id in campaign_ids else None,
+            filename=filename, created_at=created_at, size=size, sha256=digest,
+            compressed=filename.endswith('.gz')
+        ))
+        indexed.add(filename)
+        count += 1
+    db.session.commit()
+    return count
+
+
+def iter_gunzip(path):
+    """Yield the decompressed content of a gzip file in chunks."""
+    with gzip.open(path, 'rb') as f:
+        while chunk := f.read(STREAM_CHUNK_SIZE):
+            yield chunk
+
+
+def _iter_file(path):
+    with open(path, 'rb') as f:
+        while chunk := f.read(STREAM_CHUNK_SIZE):
+            yield chunk
+
+
+class _HashingWriter:
+    """File wrapper that counts and hashes the bytes written through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        self.sha256.update(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+
+def _write_file(path, chunks, compress):
+    """
+    Write byte chunks to path, gzip-compressed if asked, and return the stored size and sha256.
+
+    The file is written to a temporary file next to path and renamed over it
+    once complete, so readers never see a partly written report.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with open(fd, 'wb') as raw:
+            stored = _HashingWriter(raw)
+            if compress:
+                with gzip.GzipFile(filename='', mode='wb', fileobj=stored) as stream:
+                    for chunk in chunks:
+                        stream.write(chunk)
+            else:
+                for chunk in chunks:
+                    stored.write(chunk)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return stored.size, stored.sha256.hexdigest()
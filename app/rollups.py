@@ -0,0 +1,279 @@
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import AssetChange, Campaign, CampaignAsset, CampaignRollup, Event, EventTypeRollup, Mission, MissionRollup
+
+LOW_STOCK_LIMIT = 3  # Pool entries below this quantity, but not empty, count as low stock
+
+POOL_FIELDS = ['asset_count', 'low_stock_count', 'depleted_count', 'total_initial', 'total_current']
+LEDGER_FIELDS = ['event_count', 'change_count', 'gains', 'losses']
+
+
+def lock_campaign_ledger(*campaign_ids):
+    """
+    Lock the campaign rows until the transaction ends, in id order (SELECT ... FOR NO KEY UPDATE).
+
+    This is the outermost lock of every write to a campaign's pool, ledger,
+    snapshots or rollups: take it before touching any of them, so concurrent
+    writers queue on the campaign row instead of deadlocking on the rows
+    below it. Taking it again in the same transaction is a cheap no-op.
+    """
+    ids = sorted({int(campaign_id) for campaign_id in campaign_ids if campaign_id is not None})
+    if ids:
+        db.session.query(Campaign.id).filter(Campaign.id.in_(ids)).order_by(Campaign.id).with_for_update(key_share=True).all()
+
+
+def refresh_pool_rollups(*campaign_ids):
+    """
+    Recount the pool figures of the given campaigns' rollups.
+
+    Pool quantities are clamped at 0 by the database, so the figures are
+    recounted with one aggregate query instead of being adjusted by deltas.
+    The rollup rows are locked (in id order) before the recount, nested under
+    the campaign lock, so a concurrent pool writer recounts only after this
+    transaction commits and the last recount always sees every committed
+    write. Campaigns without a rollup row are skipped; theirs is built when
+    read.
+    """
+    ids = {int(campaign_id) for campaign_id in campaign_ids if campaign_id is not None}
+    if not ids:
+        return
+    lock_campaign_ledger(*ids)
+    ids = [campaign_id for (campaign_id,) in db.session.query(CampaignRollup.campaign_id).filter(
+        CampaignRollup.campaign_id.in_(ids)
+    ).order_by(CampaignRollup.campaign_id).with_for_update()]
+    if not ids:
+        return
+    figures = _pool_figures(ids)
+    for campaign_id in ids:
+        CampaignRollup.query.filter_by(campaign_id=campaign_id).update(
+            dict(figures.get(campaign_id, dict.fromkeys(POOL_FIELDS, 0)), updated_at=datetime.utcnow()),
+            synchronize_session=False
+        )
+
+
+def record_ledger_changes(campaign_id, mission_id, event_type, events=0, quantity_changes=(), removed=False):
+    """Add (or with removed, subtract) events and asset changes of one mission to the campaign rollups."""
+    record_ledger_batch(campaign_id, [(mission_id, event_type, events, quantity_changes)], removed)
+
+
+def record_ledger_batch(campaign_id, entries, removed=False):
+    """
+    Record several (mission_id, event_type, events, quantity_changes) entries in the campaign rollups.
+
+    Deltas are summed per campaign, mission and event type and applied with
+    UPDATE ... SET column = column + delta, so concurrent writers never lose
+    each other's counts; the number of statements does not grow with the
+    batch. Missing mission and event type rows are inserted under the campaign
+    lock, so two first writers never race to insert the same row. Nothing is
+    recorded for a campaign without a rollup row.
+    """
+    sign = -1 if removed else 1
+    missions = {}
+    event_types = {}
+    for mission_id, event_type, events, quantity_changes in entries:
+        quantity_changes = list(quantity_changes)
+        delta = missions.setdefault(mission_id, dict.fromkeys(LEDGER_FIELDS, 0))
+        delta['event_count'] += sign * events
+        delta['change_count'] += sign * len(quantity_changes)
+        delta['gains'] += sign * sum(change for change in quantity_changes if change > 0)
+        delta['losses'] += sign * sum(-change for change in quantity_changes if change < 0)
+        if events:
+            event_types[event_type] = event_types.get(event_type, 0) + sign * events
+    missions = {mission_id: delta for mission_id, delta in missions.items() if any(delta.values())}
+    event_types = {event_type: count for event_type, count in event_types.items() if count}
+    if not missions and not event_types:
+        return
+
+    lock_campaign_ledger(campaign_id)
+    totals = {field: sum(delta[field] for delta in missions.values()) for field in LEDGER_FIELDS}
+    if not _add(CampaignRollup, [CampaignRollup.campaign_id == campaign_id], totals, updated_at=datetime.utcnow()):
+        return
+    _add_or_insert(MissionRollup, MissionRollup.mission_id, {
+        mission_id: dict(delta, campaign_id=campaign_id) for mission_id, delta in missions.items()
+    }, LEDGER_FIELDS)
+    _add_or_insert(EventTypeRollup, EventTypeRollup.event_type, {
+        event_type: {'event_count': count, 'campaign_id': campaign_id} for event_type, count in event_types.items()
+    }, ['event_count'], EventTypeRollup.campaign_id == campaign_id)
+
+
+def remove_mission_from_rollups(campaign_id, mission_id):
+    """Subtract a mission about to be deleted, with its events and changes, from the campaign rollups."""
+    lock_campaign_ledger(campaign_id)
+    rollup = db.session.get(MissionRollup, mission_id)
+    if rollup is None:
+        return
+    delta = {field: -getattr(rollup, field) for field in LEDGER_FIELDS}
+    if _add(CampaignRollup, [CampaignRollup.campaign_id == campaign_id], delta, updated_at=datetime.utcnow()):
+        for event_type, count in db.session.query(Event.event_type, db.func.count(Event.id)).filter(
+            Event.mission_id == mission_id
+        ).group_by(Event.event_type):
+            _add(EventTypeRollup, [EventTypeRollup.campaign_id == campaign_id, EventTypeRollup.event_type == event_type],
+                 {'event_count': -count})
+    db.session.delete(rollup)
+
+
+def load_campaign_rollup(campaign_id):
+    """
+    Return the campaign's rollup row, building and committing it first if it is missing.
+
+    Only call this from read-only views, as building it commits the session.
+    """
+    rollup = db.session.get(CampaignRollup, campaign_id)
+    if rollup is not None:
+        return rollup
+    try:
+        rebuild_rollups(campaign_id)
+        db.session.commit()
+    except IntegrityError:
+        # Another request built it at the same time
+        db.session.rollback()
+    return db.session.get(CampaignRollup, campaign_id)
+
+
+def mission_rollup_figures(mission_id):
+    """Ledger totals of a mission from its rollup; the campaign's rollup must be loaded first."""
+    rollup = db.session.get(MissionRollup, mission_id)
+    return {field: getattr(rollup, field) if rollup else 0 for field in LEDGER_FIELDS}
+
+
+def event_type_counts(campaign_id):
+    """Events per type of a campaign from its rollup; the campaign's rollup must be loaded first."""
+    return dict(db.session.query(EventTypeRollup.event_type, EventTypeRollup.event_count).filter(
+        EventTypeRollup.campaign_id == campaign_id, EventTypeRollup.event_count != 0
+    ).order_by(EventTypeRollup.event_type).all())
+
+
+def rebuild_rollups(campaign_id):
+    """
+    Recompute a campaign's rollups from the raw rows and replace the stored ones.
+
+    Returns the differences found between the stored and the recomputed
+    figures, as a list of (table, key, field, stored, actual) tuples; a
+    campaign that had no rollup yet reports none. Runs under the campaign
+    lock, so it never interleaves with a ledger or pool writer. The caller
+    commits.
+    """
+    lock_campaign_ledger(campaign_id)
+    had_rollup = db.session.get(CampaignRollup, campaign_id) is not None
+    stored = stored_rollups(campaign_id)
+    actual = compute_rollups(campaign_id)
+    differences = _compare(stored, actual) if had_rollup else []
+
+    for model in (CampaignRollup, MissionRollup, EventTypeRollup):
+        model.query.filter_by(campaign_id=campaign_id).delete(synchronize_session=False)
+    for instance in [instance for instance in db.session.identity_map.values()
+                     if isinstance(instance, (CampaignRollup, MissionRollup, EventTypeRollup))]:
+        db.session.expunge(instance)
+
+    db.session.execute(db.insert(CampaignRollup), [dict(actual['campaign'][campaign_id], campaign_id=campaign_id)])
+    if actual['missions']:
+        db.session.execute(db.insert(MissionRollup), [
+            dict(figures, mission_id=mission_id, campaign_id=campaign_id)
+            for mission_id, figures in actual['missions'].items()
+        ])
+    if actual['event_types']:
+        db.session.execute(db.insert(EventTypeRollup), [
+            {'campaign_id': campaign_id, 'event_type': event_type, 'event_count': figures['event_count']}
+            for event_type, figures in actual['event_types'].items()
+        ])
+    return differences
+
+
+def compute_rollups(campaign_id):
+    """Compute a campaign's rollup figures from the raw pool, event and asset change rows."""
+    missions = {}
+    for mission_id, event_count, change_count, gains, losses in db.session.query(
+        Mission.id, db.func.count(db.distinct(Event.id)), db.func.count(AssetChange.id),
+        db.func.coalesce(db.func.sum(db.case((AssetChange.quantity_change > 0, AssetChange.quantity_change), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((AssetChange.quantity_change < 0, -AssetChange.quantity_change), else_=0)), 0)
+    ).outerjoin(Event, Event.mission_id == Mission.id).outerjoin(AssetChange, AssetChange.event_id == Event.id).filter(
+        Mission.campaign_id == campaign_id
+    ).group_by(Mission.id):
+        if event_count:
+            missions[mission_id] = {'event_count': event_count, 'change_count': change_count,
+                                    'gains': gains, 'losses': losses}
+
+    event_types = {event_type: {'event_count': count} for event_type, count in db.session.query(
+        Event.event_type, db.func.count(Event.id)
+    ).join(Mission, Event.mission_id == Mission.id).filter(Mission.campaign_id == campaign_id).group_by(Event.event_type)}
+
+    campaign = _pool_figures({campaign_id}).get(campaign_id, dict.fromkeys(POOL_FIELDS, 0))
+    for field in LEDGER_FIELDS:
+        campaign[field] = sum(figures[field] for figures in missions.values())
+    return {'campaign': {campaign_id: campaign}, 'missions': missions, 'event_types': event_types}
+
+
+def stored_rollups(campaign_id):
+    """Read a campaign's stored rollups in the shape compute_rollups returns."""
+    rollup = db.session.get(CampaignRollup, campaign_id)
+    return {
+        'campaign': {campaign_id: {field: getattr(rollup, field) for field in POOL_FIELDS + LEDGER_FIELDS}} if rollup else {},
+        'missions': {row.mission_id: {field: getattr(row, field) for field in LEDGER_FIELDS}
+                     for row in MissionRollup.query.filter_by(campaign_id=campaign_id)
+                     if any(getattr(row, field) for field in LEDGER_FIELDS)},
+        'event_types': {row.event_type: {'event_count': row.event_count}
+                        for row in EventTypeRollup.query.filter_by(campaign_id=campaign_id) if row.event_count}
+    }
+
+
+def _compare(stored, actual):
+    differences = []
+    for table in ('campaign', 'missions', 'event_types'):
+        for key in sorted(stored[table].keys() | actual[table].keys(), key=str):
+            stored_figures = stored[table].get(key, {})
+            actual_figures = actual[table].get(key, {})
+            for field in sorted(stored_figures.keys() | actual_figures.keys()):
+                if stored_figures.get(field, 0) != actual_figures.get(field, 0):
+                    differences.append((table, key, field, stored_figures.get(field, 0), actual_figures.get(field, 0)))
+    return differences
+
+
+def _pool_figures(campaign_ids):
+    current = CampaignAsset.current_quantity
+    return {row.campaign_id: {
+        'asset_count': row.asset_count,
+        'low_stock_count': row.low_stock_count,
+        'depleted_count': row.depleted_count,
+        'total_initial': row.total_initial,
+        'total_current': row.total_current
+    } for row in db.session.query(
+        CampaignAsset.campaign_id,
+        db.func.count(CampaignAsset.id).label('asset_count'),
+        db.func.sum(db.case(((current > 0) & (current < LOW_STOCK_LIMIT), 1), else_=0)).label('low_stock_count'),
+        db.func.sum(db.case((current == 0, 1), else_=0)).label('depleted_count'),
+        db.func.sum(CampaignAsset.initial_quantity).label('total_initial'),
+        db.func.sum(current).label('total_current')
+    ).filter(CampaignAsset.campaign_id.in_(campaign_ids)).group_by(CampaignAsset.campaign_id)}
+
+
+def _add_or_insert(model, key_column, deltas, fields, *criteria):
+    """
+    Add {key: delta} to the existing rows of model with one executemany UPDATE and insert the rest.
+
+    The caller must hold the campaign lock, which keeps the rows from being
+    inserted between the SELECT and the INSERT.
+    """
+    if not deltas:
+        return
+    existing = {key for (key,) in db.session.query(key_column).filter(key_column.in_(deltas), *criteria)}
+    table = model.__table__
+    if existing:
+        db.session.execute(
+            table.update().where(table.c[key_column.key] == db.bindparam('row_key'), *criteria).values(
+                {field: table.c[field] + db.bindparam(f'delta_{field}') for field in fields}
+            ),
+            [dict({'row_key': key}, **{f'delta_{field}': deltas[key][field] for field in fields}) for key in existing]
+        )
+    missing = [dict(delta, **{key_column.key: key}) for key, delta in deltas.items() if key not in existing]
+    if missing:
+        db.session.execute(db.insert(model), missing)
+
+
+def _add(model, criteria, delta, **values):
+    """Add delta to the columns of the rows matching criteria in one UPDATE; returns the rows matched."""
+    changes = {getattr(model, field): getattr(model, field) + amount for field, amount in delta.items()}
+    changes.update({getattr(model, field): value for field, value in values.items()})
+    return model.query.filter(*criteria).update(changes, synchronize_session=False)
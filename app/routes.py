@@ -1,80 +1,235 @@
-from flask import Blueprint, render_template, jsonify, request, flash, redirect, url_for, send_file, make_response, session
+from flask import Blueprint, render_template, jsonify, request, flash, redirect, url_for, send_file, make_response, session, current_app, abort, Response, stream_with_context
 from flask_login import login_required, current_user
-from app import db
-from app.models import Campaign, Asset, CampaignAsset, Mission, Event, AssetChange, Log, User, AssetLibrary, CampaignLibraryImport
-from datetime import datetime
+from markupsafe import Markup
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+from app import db, page_cache, active_campaign_cache, report_jobs
+from app.rollups import load_campaign_rollup, lock_campaign_ledger, mission_rollup_figures, record_ledger_batch, record_ledger_changes, refresh_pool_rollups, remove_mission_from_rollups
+from app.reports import archive_final_report, campaign_statistics, generate_final_report, iter_chunks, iter_gunzip, iter_json, iter_ledger_csv, iter_pool_csv
+from app.models import Campaign, Asset, CampaignAsset, Mission, Event, AssetChange, User, AssetLibrary, CampaignLibraryImport, InventorySnapshot, InventorySnapshotItem, ReportArchive, normalize_asset_name
+from datetime import datetime, time, timedelta, timezone
+from collections import Counter, namedtuple
 import json
 import csv
 import io
 import os
+import re
 
 main = Blueprint('main', __name__)
 
-# Helper function for library syncing
-def sync_library_to_campaigns(library_id):
+EVENT_TYPES = ['combat', 'logistics', 'training', 'other']
+REMOVAL_POLICIES = ['flag', 'remove']  # What library sync does with retired assets still in a pool
+UPLOAD_ERRORS_REPORTED = 20  # Invalid upload rows listed back to the user
+ASSET_CHANGE_FIELD = re.compile(r'asset_changes\[(\d+)\]\[asset_id\]')
+
+# Helper functions for library syncing
+def add_missing_library_assets(library_id, campaign_id=None):
+    """
+    Add every current asset of a library that is missing from the pools of the campaigns importing it.
+
+    Runs as a single INSERT ... SELECT ... WHERE NOT EXISTS over the library's
+    imports (limited to one campaign if campaign_id is given), with new entries
+    starting at the asset's default quantity.
+
+    Returns: Counter of added pool entries per campaign_id
+    """
+    existing = db.select(CampaignAsset.id).where(
+        CampaignAsset.campaign_id == CampaignLibraryImport.campaign_id,
+        CampaignAsset.asset_id == Asset.id
+    )
+    missing = db.select(
+        CampaignLibraryImport.campaign_id,
+        Asset.id,
+        Asset.library_id,
+        Asset.default_quantity,
+        Asset.default_quantity
+    ).join(Asset, Asset.library_id == CampaignLibraryImport.library_id).where(
+        CampaignLibraryImport.library_id == library_id,
+        Asset.retired_at.is_(None),
+        ~existing.exists()
+    )
+    if campaign_id is not None:
+        missing = missing.where(CampaignLibraryImport.campaign_id == campaign_id)
+        lock_campaign_ledger(campaign_id)
+    else:
+        lock_campaign_ledger(*[importing_id for (importing_id,) in db.session.query(
+            CampaignLibraryImport.campaign_id).filter_by(library_id=library_id)])
+    
+    statement = db.insert(CampaignAsset).from_select(
+        ['campaign_id', 'asset_id', 'library_id', 'initial_quantity', 'current_quantity'], missing
+    ).returning(CampaignAsset.campaign_id)
+    added = Counter(db.session.execute(statement).scalars())
+    refresh_pool_rollups(*added)
+    return added
+
+def plan_library_sync(library_id, campaign_id=None):
+    """
+    Work out what an incremental sync would change in each campaign importing a library.
+
+    Only assets updated after an import's last_synced_at watermark are looked at,
+    so the cost follows the size of the change rather than the size of the library.
+    Renames and type changes need no write since pool entries reference the
+    library asset, but they are listed so a preview shows them. Pool quantities
+    are only reset when the asset's default_quantity itself changed after the
+    watermark, so other edits keep a campaign's custom quantities. Under the
+    remove policy, retired assets still in the pool are planned whatever the
+    watermark, so switching from flag to remove clears the ones already flagged.
+
+    Each plan's synced_through is the newest updated_at the plan has seen, the
+    watermark to store once it is applied: an edit that was not visible yet
+    carries an older or equal timestamp only if a newer one committed first.
+
+    Returns: list of per-campaign plans with added, updated, quantity, removed and flagged assets
+    """
+    imports = CampaignLibraryImport.query.options(joinedload(CampaignLibraryImport.campaign)).filter_by(library_id=library_id)
+    if campaign_id is not None:
+        imports = imports.filter_by(campaign_id=campaign_id)
+    imports = imports.order_by(CampaignLibraryImport.campaign_id).all()
+    if not imports:
+        return []
+    
+    oldest_watermark = min(library_import.last_synced_at or datetime.min for library_import in imports)
+    pending = Asset.updated_at > oldest_watermark
+    removing = [library_import.campaign_id for library_import in imports if library_import.removal_policy == 'remove']
+    if removing:
+        pending = db.or_(pending, db.and_(Asset.retired_at.isnot(None), Asset.id.in_(
+            db.select(CampaignAsset.asset_id).where(CampaignAsset.campaign_id.in_(removing))
+        )))
+    changed = Asset.query.filter(Asset.library_id == library_id, pending).order_by(Asset.name).all()
+    newest = max((asset.updated_at for asset in changed if asset.updated_at > oldest_watermark), default=None)
+    
+    pool, used = {}, set()
+    if changed:
+        campaign_ids = [library_import.campaign_id for library_import in imports]
+        pool = {(ca.campaign_id, ca.asset_id): ca for ca in CampaignAsset.query.filter(
+            CampaignAsset.campaign_id.in_(campaign_ids),
+            CampaignAsset.asset_id.in_([asset.id for asset in changed])
+        )}
+        retired_ids = [asset.id for asset in changed if asset.retired_at]
+        if retired_ids and removing:
+            # Retired assets with ledger history stay in the pool, whatever the policy
+            used = set(db.session.query(Mission.campaign_id, AssetChange.asset_id).join(
+                Event, Event.mission_id == Mission.id).join(AssetChange, AssetChange.event_id == Event.id).filter(
+                Mission.campaign_id.in_(campaign_ids), AssetChange.asset_id.in_(retired_ids)).distinct())
+    
+    plans = []
+    for library_import in imports:
+        watermark = library_import.last_synced_at or datetime.min
+        plan = {
+            'campaign_id': library_import.campaign_id,
+            'campaign_name': library_import.campaign.name,
+            'removal_policy': library_import.removal_policy,
+            'synced_through': max(filter(None, (library_import.last_synced_at, newest)), default=None),
+            'added': [], 'updated': [], 'quantity': [], 'removed': [], 'flagged': []
+        }
+        for asset in changed:
+            campaign_asset = pool.get((library_import.campaign_id, asset.id))
+            removable = (asset.retired_at and campaign_asset is not None and library_import.removal_policy == 'remove'
+                         and (library_import.campaign_id, asset.id) not in used)
+            if asset.updated_at <= watermark and not removable:
+                continue
+            entry = {'asset_id': asset.id, 'name': asset.name, 'type': asset.type}
+            if asset.retired_at:
+                if campaign_asset is None:
+                    continue
+                entry['pool_id'] = campaign_asset.id
+                if removable:
+                    plan['removed'].append(entry)
+                else:
+                    plan['flagged'].append(entry)
+            elif campaign_asset is None:
+                entry['quantity'] = asset.default_quantity
+                plan['added'].append(entry)
+            elif (asset.quantity_updated_at and asset.quantity_updated_at > watermark
+                  and campaign_asset.initial_quantity != asset.default_quantity):
+                entry.update(pool_id=campaign_asset.id, previous=campaign_asset.initial_quantity, quantity=asset.default_quantity)
+                plan['quantity'].append(entry)
+            else:
+                plan['updated'].append(entry)
+        plans.append(plan)
+    return plans
+
+def apply_library_sync(library_id, plans):
+    """Write the plans from plan_library_sync in a few set-based statements. The caller commits."""
+    lock_campaign_ledger(*[plan['campaign_id'] for plan in plans])
+    added = [
+        {'campaign_id': plan['campaign_id'], 'asset_id': entry['asset_id'], 'library_id': library_id,
+         'initial_quantity': entry['quantity'], 'current_quantity': entry['quantity']}
+        for plan in plans for entry in plan['added']
+    ]
+    if added:
+        db.session.execute(db.insert(CampaignAsset), added)
+    
+    quantities = [
+        {'pool_id': entry['pool_id'], 'quantity': entry['quantity'], 'difference': entry['quantity'] - entry['previous']}
+        for plan in plans for entry in plan['quantity']
+    ]
+    if quantities:
+        # Shift current quantity by the same amount, as update_asset_quantity does
+        pool_table = CampaignAsset.__table__
+        db.session.execute(
+            pool_table.update().where(pool_table.c.id == db.bindparam('pool_id')).values(
+                initial_quantity=db.bindparam('quantity'),
+                current_quantity=pool_table.c.current_quantity + db.bindparam('difference')
+            ),
+            quantities
+        )
+    
+    removed = [entry['pool_id'] for plan in plans for entry in plan['removed']]
+    if removed:
+        CampaignAsset.query.filter(CampaignAsset.id.in_(removed)).delete(synchronize_session=False)
+    
+    refresh_pool_rollups(*[plan['campaign_id'] for plan in plans if plan['added'] or plan['quantity'] or plan['removed']])
+
+def sync_library_to_campaigns(library_id, campaign_id=None, dry_run=False):
     """
-    Sync a library's assets to all campaigns that have imported it.
-    Adds new assets that were added to the library after initial import.
-    Does not remove assets or update quantities of existing assets.
+    Sync a library's changes to the campaigns that have imported it (or just campaign_id).
+    Adds new assets, propagates default quantity changes and handles retired
+    assets according to each import's removal policy. With dry_run the plan is
+    computed and returned without writing anything.
     
-    Returns: dict with sync statistics
+    Returns: dict with sync statistics and the per-campaign plan
     """
     try:
         library = AssetLibrary.query.get(library_id)
         if not library:
             return {'success': False, 'error': 'Library not found'}
         
-        # Get all campaigns that have imported this library
-        imports = CampaignLibraryImport.query.filter_by(library_id=library_id).all()
-        
+        plans = plan_library_sync(library_id, campaign_id)
+        changed = [plan for plan in plans if plan['added'] or plan['quantity'] or plan['removed']]
         sync_stats = {
             'success': True,
-            'campaigns_updated': 0,
-            'assets_added': 0,
-            'campaigns': []
+            'dry_run': dry_run,
+            'campaigns_updated': len(changed),
+            'assets_added': sum(len(plan['added']) for plan in plans),
+            'quantities_updated': sum(len(plan['quantity']) for plan in plans),
+            'assets_removed': sum(len(plan['removed']) for plan in plans),
+            'assets_flagged': sum(len(plan['flagged']) for plan in plans),
+            'campaigns': [
+                {'name': plan['campaign_name'], 'assets_added': len(plan['added'])} for plan in changed
+            ],
+            'plan': plans
         }
+        if dry_run:
+            return sync_stats
+        
+        apply_library_sync(library_id, plans)
+        
+        # Move each watermark to the newest edit its plan saw, so edits committed meanwhile are picked up next time
+        watermarks = [{'import_campaign_id': plan['campaign_id'], 'synced_through': plan['synced_through']}
+                      for plan in plans if plan['synced_through']]
+        if watermarks:
+            import_table = CampaignLibraryImport.__table__
+            db.session.execute(
+                import_table.update().where(
+                    import_table.c.library_id == library_id, import_table.c.campaign_id == db.bindparam('import_campaign_id')
+                ).values(last_synced_at=db.bindparam('synced_through')),
+                watermarks
+            )
         
-        for library_import in imports:
-            campaign_id = library_import.campaign_id
-            campaign = Campaign.query.get(campaign_id)
-            
-            if not campaign:
-                continue
-            
-            # Get all assets from the library
-            library_assets = Asset.query.filter_by(library_id=library_id).all()
-            
-            assets_added_to_campaign = 0
-            
-            for asset in library_assets:
-                # Check if asset already exists in campaign
-                existing_asset = CampaignAsset.query.filter_by(
-                    campaign_id=campaign_id,
-                    asset_id=asset.id
-                ).first()
-                
-                if not existing_asset:
-                    # Add new asset to campaign
-                    campaign_asset = CampaignAsset(
-                        campaign_id=campaign_id,
-                        asset_id=asset.id,
-                        library_id=library_id,
-                        initial_quantity=asset.default_quantity,
-                        current_quantity=asset.default_quantity
-                    )
-                    db.session.add(campaign_asset)
-                    assets_added_to_campaign += 1
-            
-            if assets_added_to_campaign > 0:
-                sync_stats['campaigns_updated'] += 1
-                sync_stats['assets_added'] += assets_added_to_campaign
-                sync_stats['campaigns'].append({
-                    'name': campaign.name,
-                    'assets_added': assets_added_to_campaign
-                })
-            
-            # Update last_synced_at timestamp
-            library_import.last_synced_at = datetime.utcnow()
+        # Renames and other library edits show on the public pages of every affected campaign
+        bump_campaign_revision(*[plan['campaign_id'] for plan in plans
+                                 if any(plan[key] for key in ('added', 'updated', 'quantity', 'removed', 'flagged'))])
         
         # Update library's updated_at timestamp
         library.updated_at = datetime.utcnow()
@@ -86,100 +241,583 @@ def sync_library_to_campaigns(library_id):
         db.session.rollback()
         return {'success': False, 'error': str(e)}
 
+ActiveCampaign = namedtuple('ActiveCampaign', [
+    'id', 'name', 'description', 'start_date', 'map_edit_url', 'map_view_url', 'revision', 'updated_at'
+])
+
+def get_active_campaign(with_revision=False):
+    """
+    Return a snapshot of the active campaign's basic fields, or None.
+
+    The snapshot is cached per process for ACTIVE_CAMPAIGN_TTL seconds and is
+    dropped by invalidate_active_campaign() whenever the active campaign
+    changes. Its revision and updated_at are only current when with_revision
+    is set: they are then re-read with one primary-key lookup, which also
+    notices a campaign closed by another process.
+    """
+    loaded = []
+    
+    def load():
+        loaded.append(True)
+        campaign = Campaign.query.filter_by(is_active=True, is_closed=False).first()
+        if not campaign:
+            return None
+        return ActiveCampaign(campaign.id, campaign.name, campaign.description, campaign.start_date,
+                              campaign.map_edit_url, campaign.map_view_url, campaign.revision, campaign.updated_at)
+    
+    snapshot = active_campaign_cache.get_or_load(load)
+    if snapshot and with_revision and not loaded:
+        state = db.session.query(Campaign.revision, Campaign.updated_at).filter_by(
+            id=snapshot.id, is_active=True, is_closed=False
+        ).first()
+        if state is None:
+            invalidate_active_campaign()
+            return active_campaign_cache.get_or_load(load)
+        snapshot = snapshot._replace(revision=state.revision, updated_at=state.updated_at)
+    return snapshot
+
+def invalidate_active_campaign():
+    """Drop the cached active campaign; call after changing which campaign is active"""
+    active_campaign_cache.invalidate()
+
+def bump_campaign_revision(*campaign_ids):
+    """
+    Advance the revision counter of the given campaigns.
+
+    Public pages are cached per campaign revision, so every route that changes
+    what those pages show calls this before committing.
+    """
+    ids = {int(campaign_id) for campaign_id in campaign_ids if campaign_id is not None}
+    if ids:
+        Campaign.query.filter(Campaign.id.in_(ids)).update(
+            {Campaign.revision: Campaign.revision + 1, Campaign.updated_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+
+def conditional_response(campaign, tag, build_response, cache_control='public, no-cache', weak=False):
+    """
+    Answer a conditional GET for a page derived from a campaign's data.
+
+    The validators come from the campaign row alone - the revision for the ETag
+    and updated_at for Last-Modified - so a client that already holds the
+    current revision gets a 304 before any pool, mission or event query runs.
+    """
+    etag = f'{tag}-{campaign.id}-{campaign.revision}'
+    last_modified = campaign.updated_at.replace(microsecond=0) if campaign.updated_at else None
+    
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = bool(
+            last_modified and request.if_modified_since and
+            last_modified.replace(tzinfo=timezone.utc) <= request.if_modified_since
+        )
+    
+    if not_modified:
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(build_response())
+    
+    response.set_etag(etag, weak=weak)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def adjust_pool_quantity(campaign_id, asset_id, quantity_change):
+    """
+    Apply a quantity change to a campaign's pool entry as one atomic UPDATE.
+
+    The new quantity is computed and clamped at 0 by the database, so changes
+    logged in parallel for the same asset can never overwrite each other.
+    Returns the number of pool entries updated (0 if the asset is not in the pool).
+    """
+    return adjust_pool_quantities(campaign_id, {asset_id: quantity_change})
+
+def adjust_pool_quantities(campaign_id, quantity_changes):
+    """
+    Apply several {asset_id: quantity_change} deltas to a campaign's pool in one UPDATE.
+
+    Each asset's net change is applied once and clamped at 0, like adjust_pool_quantity.
+    """
+    quantity_changes = {asset_id: change for asset_id, change in quantity_changes.items() if change}
+    if not quantity_changes:
+        return 0
+    lock_campaign_ledger(campaign_id)
+    new_quantity = CampaignAsset.current_quantity + db.case(
+        quantity_changes, value=CampaignAsset.asset_id, else_=0
+    )
+    updated = CampaignAsset.query.filter(
+        CampaignAsset.campaign_id == campaign_id,
+        CampaignAsset.asset_id.in_(quantity_changes)
+    ).update(
+        {CampaignAsset.current_quantity: db.case((new_quantity < 0, 0), else_=new_quantity)},
+        synchronize_session=False
+    )
+    refresh_pool_rollups(campaign_id)
+    return updated
+
+def campaign_ids_using_asset(asset_id):
+    """Return the ids of all campaigns whose pool contains the asset"""
+    return [campaign_id for (campaign_id,) in db.session.query(CampaignAsset.campaign_id).filter_by(
+        asset_id=asset_id
+    ).distinct()]
+
+def ledger_net_changes(campaign_id, start=None, end=None):
+    """
+    Sum a campaign's asset changes per asset for events dated in [start, end).
+
+    Returns (net_changes, change_count) with net_changes as {asset_id: summed quantity_change}.
+    """
+    query = db.session.query(
+        AssetChange.asset_id,
+        db.func.sum(AssetChange.quantity_change),
+        db.func.count(AssetChange.id)
+    ).join(Event, AssetChange.event_id == Event.id).join(Mission, Event.mission_id == Mission.id).filter(
+        Mission.campaign_id == campaign_id
+    )
+    if start is not None:
+        query = query.filter(Event.event_date >= start)
+    if end is not None:
+        query = query.filter(Event.event_date < end)
+    
+    net_changes, change_count = {}, 0
+    for asset_id, net_change, count in query.group_by(AssetChange.asset_id):
+        net_changes[asset_id] = net_change
+        change_count += count
+    return net_changes, change_count
+
+def ledger_position(campaign_id, as_of):
+    """Net changes before as_of: the nearest earlier snapshot plus the ledger tail after it."""
+    snapshot = InventorySnapshot.query.filter(
+        InventorySnapshot.campaign_id == campaign_id,
+        InventorySnapshot.as_of <= as_of
+    ).order_by(InventorySnapshot.as_of.desc()).first()
+    if snapshot is None:
+        return ledger_net_changes(campaign_id, end=as_of)
+    
+    net_changes = {item.asset_id: item.net_change for item in snapshot.items}
+    change_count = snapshot.change_count
+    if snapshot.as_of < as_of:
+        tail, tail_count = ledger_net_changes(campaign_id, start=snapshot.as_of, end=as_of)
+        for asset_id, net_change in tail.items():
+            net_changes[asset_id] = net_changes.get(asset_id, 0) + net_change
+        change_count += tail_count
+    return net_changes, change_count
+
+def take_inventory_snapshot(campaign_id, as_of):
+    """Store the campaign's ledger position at as_of. The caller commits."""
+    net_changes, change_count = ledger_position(campaign_id, as_of)
+    snapshot = InventorySnapshot(
+        campaign_id=campaign_id,
+        as_of=as_of,
+        change_count=change_count,
+        items=[InventorySnapshotItem(asset_id=asset_id, net_change=net_change)
+               for asset_id, net_change in net_changes.items() if net_change]
+    )
+    db.session.add(snapshot)
+    db.session.flush()
+    return snapshot
+
+def snapshot_mission_boundaries(campaign_id):
+    """
+    Take any missing snapshots at the start of each mission day, oldest first.
+
+    Each new snapshot builds on the previous one, so filling a whole campaign
+    reads the ledger only once. The ledger lock is only taken when snapshots
+    are missing; the check is then repeated under it. Returns the number of
+    snapshots taken.
+    """
+    boundaries = {datetime.combine(mission_date, time.min) for (mission_date,) in
+                  db.session.query(Mission.mission_date).filter_by(campaign_id=campaign_id).distinct()}
+    
+    def missing_boundaries():
+        existing = {as_of for (as_of,) in
+                    db.session.query(InventorySnapshot.as_of).filter_by(campaign_id=campaign_id)}
+        return sorted(boundaries - existing)
+    
+    if not missing_boundaries():
+        return 0
+    lock_campaign_ledger(campaign_id)
+    missing = missing_boundaries()
+    for as_of in missing:
+        take_inventory_snapshot(campaign_id, as_of)
+    return len(missing)
+
+def discard_inventory_snapshots(campaign_id, changed_at):
+    """
+    Drop snapshots that cover a ledger change dated changed_at, i.e. those taken
+    for a later point in time. Call whenever asset changes are added, removed or
+    re-dated; dropped mission boundaries are retaken on the next as-of query.
+    Takes the campaign's ledger lock, which the caller's commit releases.
+    """
+    if changed_at is None:
+        return
+    lock_campaign_ledger(campaign_id)
+    stale = db.select(InventorySnapshot.id).where(
+        InventorySnapshot.campaign_id == campaign_id,
+        InventorySnapshot.as_of > changed_at
+    )
+    InventorySnapshotItem.query.filter(InventorySnapshotItem.snapshot_id.in_(stale)).delete(synchronize_session=False)
+    InventorySnapshot.query.filter(
+        InventorySnapshot.campaign_id == campaign_id,
+        InventorySnapshot.as_of > changed_at
+    ).delete(synchronize_session=False)
+
+def inventory_as_of(campaign_id, as_of):
+    """
+    Pool quantities as they stood at as_of, counting changes on events dated before it.
+
+    The ledger sum is clamped at 0 once at the end, whereas current_quantity is
+    clamped after every change, so the two can differ if the pool ever ran dry.
+    """
+    net_changes, _ = ledger_position(campaign_id, as_of)
+    pool = CampaignAsset.query.options(joinedload(CampaignAsset.asset)).filter_by(campaign_id=campaign_id).all()
+    return sorted((
+        {
+            'asset_id': ca.asset_id,
+            'name': ca.asset.name,
+            'type': ca.asset.type,
+            'initial_quantity': ca.initial_quantity,
+            'quantity': max(0, ca.initial_quantity + net_changes.get(ca.asset_id, 0))
+        }
+        for ca in pool
+    ), key=lambda a: (a['type'], a['name']))
+
+def build_public_dashboard(campaign):
+    """Collect the public asset pool and mission history of a campaign"""
+    # Get assets - one joined query, show_in_public filtered in SQL
+    campaign_assets = CampaignAsset.query.join(CampaignAsset.asset).join(CampaignAsset.library).filter(
+        CampaignAsset.campaign_id == campaign.id,
+        Asset.show_in_public == True
+    ).options(
+        contains_eager(CampaignAsset.asset),
+        contains_eager(CampaignAsset.library)
+    ).all()
+    asset_list = [{
+        'name': ca.asset.name,
+        'type': ca.asset.type,
+        'category': ca.asset.category,
+        'current_quantity': ca.current_quantity,
+        'library_name': ca.library.name
+    } for ca in campaign_assets]
+
+    # Get missions with events and asset changes (one select-in query per level)
+    missions = Mission.query.filter_by(campaign_id=campaign.id).options(
+        selectinload(Mission.events).selectinload(Event.asset_changes).joinedload(AssetChange.asset)
+    ).order_by(Mission.mission_date.desc()).all()
+    missions_list = []
+    for mission in missions:
+        mission_events = []
+        for event in sorted(mission.events, key=lambda e: e.event_date):
+            event_data = {
+                'title': event.title,
+                'date': event.event_date,
+                'type': event.event_type,
+                'description': event.description,
+                'location': event.location,
+                'asset_changes': [{
+                    'asset_name': change.asset.name,
+                    'asset_type': change.asset.type,
+                    'quantity_change': change.quantity_change
+                } for change in event.asset_changes if change.asset and change.asset.show_in_public]
+            }
+            mission_events.append(event_data)
+        
+        missions_list.append({
+            'id': mission.id,
+            'name': mission.name,
+            'date': mission.mission_date,
+            'description': mission.description,
+            'location': mission.location,
+            'status': mission.status,
+            'events': mission_events,
+            'event_count': len(mission_events),
+            'map_view_url': mission.map_view_url,
+            'map_edit_url': mission.map_edit_url
+        })
+    
+    return asset_list, missions_list
+
+def parse_timeline_filters(args):
+    """
+    Read the timeline filters and keyset cursor from a request's query string.
+
+    The cursor is "<event_date>_<event_id>" of the last event already shown;
+    the next page starts strictly after it in (event_date, id) descending order.
+    """
+    filters = {
+        'event_type': args.get('type') or None,
+        'mission_id': args.get('mission', type=int),
+        'date_from': None,
+        'date_to': None,
+        'before': None,
+        'limit': max(1, min(args.get('limit', current_app.config['TIMELINE_PAGE_SIZE'], type=int), 200))
+    }
+    try:
+        if args.get('from'):
+            filters['date_from'] = datetime.strptime(args['from'], '%Y-%m-%d')
+        if args.get('to'):
+            filters['date_to'] = datetime.strptime(args['to'], '%Y-%m-%d') + timedelta(days=1)
+        if args.get('cursor'):
+            cursor_date, cursor_id = args['cursor'].rsplit('_', 1)
+            filters['before'] = (datetime.strptime(cursor_date, '%Y%m%d%H%M%S%f'), int(cursor_id))
+    except ValueError:
+        abort(400)
+    return filters
+
+def timeline_filter_args(filters):
+    """The query-string form of parsed timeline filters, for the filter form and its API link."""
+    args = {
+        'type': filters['event_type'],
+        'mission': str(filters['mission_id']) if filters['mission_id'] is not None else None,
+        'from': filters['date_from'].strftime('%Y-%m-%d') if filters['date_from'] else None,
+        'to': (filters['date_to'] - timedelta(days=1)).strftime('%Y-%m-%d') if filters['date_to'] else None
+    }
+    return {name: value for name, value in args.items() if value}
+
+def query_timeline_events(campaign_id, event_type=None, mission_id=None, date_from=None, date_to=None, before=None, limit=50):
+    """
+    Return one page of a campaign's events, newest first, and the cursor for the next page.
+
+    Ordering, filtering and paging all happen in a single query over Event
+    joined to Mission; asset changes are select-in loaded for the page only.
+    """
+    query = Event.query.join(Event.mission).filter(Mission.campaign_id == campaign_id)
+    if event_type:
+        query = query.filter(Event.event_type == event_type)
+    if mission_id:
+        query = query.filter(Event.mission_id == mission_id)
+    if date_from:
+        query = query.filter(Event.event_date >= date_from)
+    if date_to:
+        query = query.filter(Event.event_date < date_to)
+    if before:
+        before_date, before_id = before
+        query = query.filter(db.or_(
+            Event.event_date < before_date,
+            db.and_(Event.event_date == before_date, Event.id < before_id)
+        ))
+    
+    events = query.options(
+        contains_eager(Event.mission),
+        selectinload(Event.asset_changes).joinedload(AssetChange.asset)
+    ).order_by(Event.event_date.desc(), Event.id.desc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        last = events[-1]
+        next_cursor = f"{last.event_date.strftime('%Y%m%d%H%M%S%f')}_{last.id}"
+    
+    events_list = [{
+        'id': event.id,
+        'mission_id': event.mission_id,
+        'title': f"{event.mission.name}: {event.title}",
+        'date': event.event_date.strftime('%Y-%m-%d %H:%M'),
+        'type': event.event_type,
+        'description': event.description or event.notes or '',
+        'asset_changes': [{
+            'asset_name': change.asset.name,
+            'asset_type': change.asset.type,
+            'quantity_change': change.quantity_change
+        } for change in event.asset_changes]
+    } for event in events]
+    
+    return events_list, next_cursor
+
+def query_recent_events(campaign_id, limit=10, event_type=None):
+    """
+    Return the campaign's newest events, optionally of one type, for dashboard widgets.
+
+    A single ORDER BY event_date DESC LIMIT query over Event joined to Mission,
+    reading only the columns the widget shows, so the cost does not grow with
+    the campaign.
+    """
+    query = db.session.query(
+        Mission.name, Event.title, Event.event_date, Event.event_type
+    ).join(Event.mission).filter(Mission.campaign_id == campaign_id)
+    if event_type:
+        query = query.filter(Event.event_type == event_type)
+    return [{
+        'mission': mission_name,
+        'title': title,
+        'date': event_date,
+        'type': event_type
+    } for mission_name, title, event_date, event_type in query.order_by(
+        Event.event_date.desc(), Event.id.desc()
+    ).limit(limit)]
+
+def load_mission_overview(campaign_id, *order_by):
+    """
+    Load a campaign's missions with their events for the missions pages.
+
+    Two queries: the missions, then every event of the campaign with its
+    asset change count (outer join + GROUP BY), ordered by date. Returns the
+    missions, {mission_id: [event rows]} and {mission_id: asset change total},
+    so the templates never lazy-load events or changes.
+    """
+    missions = Mission.query.filter_by(campaign_id=campaign_id).order_by(*order_by).all()
+    events = {mission.id: [] for mission in missions}
+    change_counts = dict.fromkeys(events, 0)
+    for event in db.session.query(
+        Event.id, Event.mission_id, Event.title, Event.event_date, Event.event_type,
+        db.func.count(AssetChange.id).label('change_count')
+    ).join(Event.mission).outerjoin(Event.asset_changes).filter(
+        Mission.campaign_id == campaign_id
+    ).group_by(Event.id).order_by(Event.event_date, Event.id):
+        events[event.mission_id].append(event)
+        change_counts[event.mission_id] += event.change_count
+    return missions, events, change_counts
+
+def load_campaign_pool(campaign_id):
+    """
+    Load the libraries and grouped asset pool shown on the campaign pages.
+
+    A fixed number of queries however large the catalog is: the libraries,
+    their asset counts from one GROUP BY, the campaign's imports, and the
+    pool with its assets and libraries in one joined query ordered by
+    library. Returns the template context shared by campaign_detail and
+    manager_campaign.
+    """
+    all_libraries = AssetLibrary.query.order_by(AssetLibrary.name).all()
+    library_asset_counts = dict(db.session.query(Asset.library_id, db.func.count(Asset.id)).group_by(Asset.library_id))
+    
+    # Import records resolve their library from the libraries already loaded
+    library_imports = CampaignLibraryImport.query.filter_by(campaign_id=campaign_id).order_by(CampaignLibraryImport.id).all()
+    imported_library_ids = [record.library_id for record in library_imports]
+    imported = set(imported_library_ids)
+    imported_libraries = [library for library in all_libraries if library.id in imported]
+    
+    campaign_assets = CampaignAsset.query.filter_by(campaign_id=campaign_id).join(CampaignAsset.asset).join(
+        CampaignAsset.library
+    ).options(
+        contains_eager(CampaignAsset.asset), contains_eager(CampaignAsset.library)
+    ).order_by(AssetLibrary.name, CampaignAsset.id).all()
+    assets_by_library = {}
+    for ca in campaign_assets:
+        assets_by_library.setdefault(ca.library.name, []).append(ca)
+    
+    return {
+        'all_libraries': all_libraries,
+        'library_asset_counts': library_asset_counts,
+        'library_imports': library_imports,
+        'imported_libraries': imported_libraries,
+        'imported_library_ids': imported_library_ids,
+        'campaign_assets': campaign_assets,
+        'assets_by_library': assets_by_library
+    }
+
 # Public routes
 @main.route('/')
 def index():
-    current_campaign = Campaign.query.filter_by(is_active=True, is_closed=False).first()
-    missions_list = []
+    current_campaign = get_active_campaign(with_revision=True)
+    is_manager = current_user.is_authenticated and current_user.is_manager
     
-    if current_campaign:
-        # Get assets - using new CampaignAsset model, filter by show_in_public
-        campaign_assets = CampaignAsset.query.filter_by(campaign_id=current_campaign.id).all()
-        asset_list = [{
-            'name': ca.asset.name,
-            'type': ca.asset.type,
-            'category': ca.asset.category,
-            'current_quantity': ca.current_quantity,
-            'library_name': ca.library.name
-        } for ca in campaign_assets if ca.asset.show_in_public]  # Filter here
-        
-        # Get missions with events grouped
-        missions = Mission.query.filter_by(campaign_id=current_campaign.id).order_by(Mission.mission_date.desc()).all()
-        for mission in missions:
-            mission_events = []
-            for event in mission.events:
-                event_data = {
-                    'title': event.title,
-                    'date': event.event_date,
-                    'type': event.event_type,
-                    'description': event.description,
-                    'location': event.location
-                }
-                mission_events.append(event_data)
-            
-            missions_list.append({
-                'id': mission.id,
-                'name': mission.name,
-                'date': mission.mission_date,
-                'description': mission.description,
-                'location': mission.location,
-                'status': mission.status,
-                'events': mission_events,
-                'event_count': len(mission_events),
-                'map_view_url': mission.map_view_url,
-                'map_edit_url': mission.map_edit_url
-            })
-    else:
-        asset_list = []
+    def render_content():
+        asset_list, missions_list = build_public_dashboard(current_campaign) if current_campaign else ([], [])
+        return render_template('public/_dashboard_content.html',
+                               campaign=current_campaign,
+                               assets=asset_list,
+                               missions=missions_list,
+                               is_manager=is_manager)
+    
+    if not current_campaign:
+        return render_template('public/dashboard.html', campaign=None, content=Markup(render_content()))
     
-    return render_template('public/dashboard.html', 
-                         campaign=current_campaign, 
-                         assets=asset_list,
-                         missions=missions_list)
+    def render_page():
+        # Cached per campaign revision - only rebuilt after a manager changes something
+        content = page_cache.get_or_render(
+            ('index', current_campaign.id, current_campaign.revision, is_manager),
+            render_content
+        )
+        return render_template('public/dashboard.html', 
+                             campaign=current_campaign, 
+                             content=Markup(content))
+    
+    # Weak validator: the page shell embeds a per-request CSP nonce and CSRF token
+    response = conditional_response(current_campaign, f'index-{int(is_manager)}', render_page,
+                                    cache_control='private, no-cache', weak=True)
+    response.vary.add('Cookie')
+    return response
 
 @main.route('/api/current-pool')
 def current_pool():
-    current_campaign = Campaign.query.filter_by(is_active=True, is_closed=False).first()
+    current_campaign = get_active_campaign(with_revision=True)
     if not current_campaign:
         return jsonify([])
     
-    assets = CampaignAsset.query.filter_by(campaign_id=current_campaign.id).all()
-    return jsonify([{
-        'name': lib.asset.name,
-        'type': lib.asset.type,
-        'current_quantity': lib.current_quantity
-    } for lib in assets])
+    def render_pool():
+        assets = CampaignAsset.query.join(CampaignAsset.asset).filter(
+            CampaignAsset.campaign_id == current_campaign.id
+        ).options(contains_eager(CampaignAsset.asset)).all()
+        return jsonify([{
+            'name': lib.asset.name,
+            'type': lib.asset.type,
+            'current_quantity': lib.current_quantity
+        } for lib in assets]).get_data()
+    
+    def render_response():
+        body = page_cache.get_or_render(
+            ('current_pool', current_campaign.id, current_campaign.revision),
+            render_pool
+        )
+        return current_app.response_class(body, mimetype='application/json')
+    
+    return conditional_response(current_campaign, 'pool', render_response)
 
 @main.route('/timeline')
 def timeline():
-    current_campaign = Campaign.query.filter_by(is_active=True, is_closed=False).first()
-    events_list = []
-    
-    if current_campaign:
-        missions = Mission.query.filter_by(campaign_id=current_campaign.id).order_by(Mission.order_index).all()
-        for mission in missions:
-            for event in mission.events:
-                # Get asset changes for this event
-                asset_changes = []
-                for change in event.asset_changes:
-                    asset_changes.append({
-                        'asset_name': change.asset.name,
-                        'asset_type': change.asset.type,
-                        'quantity_change': change.quantity_change
-                    })
-                
-                events_list.append({
-                    'title': f"{mission.name}: {event.title}",
-                    'date': event.event_date.strftime('%Y-%m-%d %H:%M'),
-                    'type': event.event_type,
-                    'description': event.description or event.notes or '',
-                    'asset_changes': asset_changes
-                })
-    
-    # Sort events by date (newest first)
-    events_list.sort(key=lambda x: x['date'], reverse=True)
-    
-    return render_template('public/timeline.html', events=events_list)
+    current_campaign = get_active_campaign(with_revision=True)
+    filters = parse_timeline_filters(request.args)
+    
+    def render_content():
+        events_list, next_cursor = query_timeline_events(current_campaign.id, **filters) if current_campaign else ([], None)
+        missions = db.session.query(Mission.id, Mission.name).filter_by(
+            campaign_id=current_campaign.id
+        ).order_by(Mission.order_index).all() if current_campaign else []
+        return render_template('public/_timeline_content.html',
+                               events=events_list,
+                               next_cursor=next_cursor,
+                               missions=missions,
+                               event_types=EVENT_TYPES,
+                               filters=timeline_filter_args(filters))
+    
+    if not current_campaign:
+        return render_template('public/timeline.html', content=Markup(render_content()))
+    
+    def render_page():
+        content = page_cache.get_or_render(
+            ('timeline', current_campaign.id, current_campaign.revision, tuple(sorted(filters.items()))),
+            render_content
+        )
+        return render_template('public/timeline.html', content=Markup(content))
+    
+    response = conditional_response(current_campaign, 'timeline', render_page,
+                                    cache_control='private, no-cache', weak=True)
+    response.vary.add('Cookie')
+    return response
+
+@main.route('/api/timeline')
+def timeline_api():
+    """One page of the active campaign's timeline as JSON, for incremental loading"""
+    current_campaign = get_active_campaign(with_revision=True)
+    filters = parse_timeline_filters(request.args)
+    if not current_campaign:
+        return jsonify({'events': [], 'next_cursor': None})
+    
+    def render_page():
+        events_list, next_cursor = query_timeline_events(current_campaign.id, **filters)
+        return jsonify({'events': events_list, 'next_cursor': next_cursor}).get_data()
+    
+    def render_response():
+        body = page_cache.get_or_render(
+            ('timeline_api', current_campaign.id, current_campaign.revision, tuple(sorted(filters.items()))),
+            render_page
+        )
+        return current_app.response_class(body, mimetype='application/json')
+    
+    return conditional_response(current_campaign, 'timeline-api', render_response)
 
 # Admin routes - require login
 @main.route('/admin')
@@ -195,7 +833,7 @@ def admin_dashboard():
         return redirect(url_for('main.index'))
     
     campaigns = Campaign.query.order_by(Campaign.created_at.desc()).all()
-    active_campaign = Campaign.query.filter_by(is_active=True, is_closed=False).first()
+    active_campaign = get_active_campaign()
     
     return render_template('admin/dashboard.html', 
                          campaigns=campaigns,
@@ -218,17 +856,17 @@ def campaign_missions(campaign_id):
             flash('Managers can only access the active campaign.', 'error')
             return redirect(url_for('main.manager_dashboard'))
     
-    missions = Mission.query.filter_by(campaign_id=campaign_id).all()
+    missions, mission_events, change_counts = load_mission_overview(campaign_id)
     
     # Get max order index for new mission
-    max_order = db.session.query(db.func.max(Mission.order_index)).filter_by(
-        campaign_id=campaign_id
-    ).scalar() or 0
+    max_order = max((mission.order_index or 0 for mission in missions), default=0)
     
     today = datetime.now().strftime('%Y-%m-%d')
     return render_template('admin/missions.html', 
                          campaign=campaign, 
                          missions=missions,
+                         mission_events=mission_events,
+                         change_counts=change_counts,
                          max_order=max_order,
                          today=today)
 
@@ -260,6 +898,7 @@ def add_mission():
         )
         
         db.session.add(mission)
+        bump_campaign_revision(campaign_id)
         db.session.commit()
         
         flash(f'Mission "{mission.name}" added successfully!', 'success')
@@ -297,6 +936,7 @@ def edit_mission():
         order_index_str = request.form.get('order_index', '0')
         mission.order_index = int(order_index_str) if order_index_str.strip() else 0
         
+        bump_campaign_revision(mission.campaign_id)
         db.session.commit()
         
         flash(f'Mission "{mission.name}" updated successfully!', 'success')
@@ -323,9 +963,14 @@ def delete_mission():
         mission_id = request.form['mission_id']
         mission = Mission.query.get_or_404(mission_id)
         campaign_id = mission.campaign_id
+        lock_campaign_ledger(campaign_id)
         
         # Delete associated events and asset changes
+        discard_inventory_snapshots(campaign_id, db.session.query(db.func.min(Event.event_date)).filter(
+            Event.mission_id == mission.id).scalar())
+        remove_mission_from_rollups(campaign_id, mission.id)
         db.session.delete(mission)
+        bump_campaign_revision(campaign_id)
         db.session.commit()
         
         flash(f'Mission "{mission.name}" deleted successfully!', 'success')
@@ -344,29 +989,25 @@ def mission_events(mission_id):
         return redirect(url_for('main.index'))
     
     mission = Mission.query.get_or_404(mission_id)
-    events = Event.query.filter_by(mission_id=mission_id).order_by(Event.event_date).all()
     
-    # Get campaign assets for adding asset changes
-    campaign_assets = CampaignAsset.query.filter_by(
-        campaign_id=mission.campaign_id
-    ).all()
+    # Statistics come from the mission's rollup
+    load_campaign_rollup(mission.campaign_id)
+    figures = mission_rollup_figures(mission.id)
     
-    # Calculate statistics
-    total_asset_changes = 0
-    asset_gains = 0
-    asset_losses = 0
+    # Asset changes and their assets are select-in loaded for all events at once
+    events = Event.query.filter_by(mission_id=mission_id).options(
+        selectinload(Event.asset_changes).joinedload(AssetChange.asset)
+    ).order_by(Event.event_date).all()
     
-    for event in events:
-        for change in event.asset_changes:
-            total_asset_changes += 1
-            if change.quantity_change > 0:
-                asset_gains += change.quantity_change
-            else:
-                asset_losses += abs(change.quantity_change)
+    # Campaign assets for the asset change pickers, as a lightweight projection
+    campaign_assets = db.session.query(
+        CampaignAsset.asset_id, Asset.name, Asset.type, CampaignAsset.current_quantity
+    ).join(CampaignAsset.asset).filter(
+        CampaignAsset.campaign_id == mission.campaign_id
+    ).order_by(Asset.name).all()
     
     # Default event time (mission date at 12:00)
     # Convert mission_date (date) to datetime for the form
-    from datetime import datetime, time
     default_event_datetime = datetime.combine(mission.mission_date, time(12, 0))
     default_event_time = default_event_datetime.strftime('%Y-%m-%dT%H:%M')
     
@@ -374,11 +1015,31 @@ def mission_events(mission_id):
                          mission=mission,
                          events=events,
                          campaign_assets=campaign_assets,
-                         total_asset_changes=total_asset_changes,
-                         asset_gains=asset_gains,
-                         asset_losses=asset_losses,
+                         total_asset_changes=figures['change_count'],
+                         asset_gains=figures['gains'],
+                         asset_losses=figures['losses'],
                          default_event_time=default_event_time)
 
+def parse_asset_change_rows(form):
+    """
+    Collect the asset_changes[i][...] rows of the event form.
+
+    Rows without an asset or with a zero change are skipped. Indices need not be
+    contiguous, since rows removed in the browser leave gaps.
+    """
+    rows = []
+    indices = sorted(int(match.group(1)) for match in map(ASSET_CHANGE_FIELD.fullmatch, form) if match)
+    for i in indices:
+        asset_id = form.get(f'asset_changes[{i}][asset_id]')
+        quantity_change = int(form.get(f'asset_changes[{i}][quantity_change]') or 0)
+        if asset_id and quantity_change != 0:
+            rows.append({
+                'asset_id': int(asset_id),
+                'quantity_change': quantity_change,
+                'notes': form.get(f'asset_changes[{i}][notes]', '')
+            })
+    return rows
+
 @main.route('/admin/event/add', methods=['POST'])
 @login_required
 def add_event():
@@ -387,8 +1048,22 @@ def add_event():
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        mission_id = request.form['mission_id']
-        campaign_id = request.form['campaign_id']
+        mission = Mission.query.get_or_404(request.form['mission_id'])
+        mission_id = mission.id
+        campaign_id = mission.campaign_id
+        rows = parse_asset_change_rows(request.form)
+        lock_campaign_ledger(campaign_id)
+        
+        # Load every referenced pool entry at once
+        pool = {}
+        if rows:
+            pool = {ca.asset_id: ca for ca in CampaignAsset.query.filter(
+                CampaignAsset.campaign_id == campaign_id,
+                CampaignAsset.asset_id.in_({row['asset_id'] for row in rows})
+            )}
+        missing = sorted({row['asset_id'] for row in rows} - pool.keys())
+        if missing:
+            raise ValueError(f'Assets not in the campaign pool: {", ".join(map(str, missing))}')
         
         event = Event(
             mission_id=mission_id,
@@ -403,49 +1078,21 @@ def add_event():
         db.session.add(event)
         db.session.flush()  # Get event ID
         
-        # Process asset changes
-        asset_changes_added = []
-        i = 0
-        while True:
-            asset_key = f'asset_changes[{i}][asset_id]'
-            if asset_key not in request.form:
-                break
-            
-            asset_id = request.form.get(asset_key)
-            if asset_id:  # Only process if asset is selected
-                quantity_change = int(request.form.get(f'asset_changes[{i}][quantity_change]', 0))
-                notes = request.form.get(f'asset_changes[{i}][notes]', '')
-                
-                if quantity_change != 0:  # Only add if there's an actual change
-                    asset_change = AssetChange(
-                        event_id=event.id,
-                        asset_id=int(asset_id),
-                        quantity_change=quantity_change,
-                        notes=notes
-                    )
-                    db.session.add(asset_change)
-                    
-                    # Update campaign asset quantity
-                    campaign_asset = CampaignAsset.query.filter_by(
-                        campaign_id=campaign_id,
-                        asset_id=asset_id
-                    ).first()
-                    
-                    if campaign_asset:
-                        campaign_asset.current_quantity += quantity_change
-                        if campaign_asset.current_quantity < 0:
-                            campaign_asset.current_quantity = 0
-
-                    asset_changes_added.append({
-                        'asset_id': asset_id,
-                        'quantity_change': quantity_change
-                    })
-            
-            i += 1
-        
+        # Insert the asset changes together and apply the net change per pool entry in one UPDATE
+        if rows:
+            db.session.execute(db.insert(AssetChange), [dict(row, event_id=event.id) for row in rows])
+            quantity_changes = {}
+            for row in rows:
+                quantity_changes[row['asset_id']] = quantity_changes.get(row['asset_id'], 0) + row['quantity_change']
+            adjust_pool_quantities(campaign_id, quantity_changes)
+            discard_inventory_snapshots(campaign_id, event.event_date)
+        record_ledger_changes(campaign_id, mission_id, event.event_type, events=1,
+                              quantity_changes=[row['quantity_change'] for row in rows])
+        
+        bump_campaign_revision(campaign_id)
         db.session.commit()
         
-        flash(f'Event "{event.title}" added successfully with {len(asset_changes_added)} asset changes!', 'success')
+        flash(f'Event "{event.title}" added successfully with {len(rows)} asset changes!', 'success')
         return redirect(url_for('main.mission_events', mission_id=mission_id))
     except Exception as e:
         db.session.rollback()
@@ -463,6 +1110,9 @@ def edit_event():
     try:
         event_id = request.form['event_id']
         event = Event.query.get_or_404(event_id)
+        lock_campaign_ledger(event.mission.campaign_id)
+        previous_date = event.event_date
+        previous_type = event.event_type
         
         event.title = request.form['title']
         event.event_type = request.form['event_type']
@@ -471,6 +1121,12 @@ def edit_event():
         event.location = request.form.get('location', '')
         event.notes = request.form.get('notes', '')
         
+        if event.event_date != previous_date:
+            discard_inventory_snapshots(event.mission.campaign_id, min(event.event_date, previous_date))
+        if event.event_type != previous_type:
+            record_ledger_changes(event.mission.campaign_id, event.mission_id, previous_type, events=1, removed=True)
+            record_ledger_changes(event.mission.campaign_id, event.mission_id, event.event_type, events=1)
+        bump_campaign_revision(event.mission.campaign_id)
         db.session.commit()
         
         flash(f'Event "{event.title}" updated successfully!', 'success')
@@ -491,22 +1147,21 @@ def delete_event():
         event_id = request.form['event_id']
         event = Event.query.get_or_404(event_id)
         mission_id = event.mission_id
+        campaign_id = event.mission.campaign_id
+        lock_campaign_ledger(campaign_id)
         
-        # First, revert asset changes
+        # First, revert asset changes, netted per asset into one UPDATE
+        reverted = Counter()
         for change in event.asset_changes:
-            # Find the campaign asset entry and revert the change
-            campaign_asset = CampaignAsset.query.filter_by(
-                campaign_id=event.mission.campaign_id,
-                asset_id=change.asset_id
-            ).first()
-            
-            if campaign_asset:
-                campaign_asset.current_quantity -= change.quantity_change
-                if campaign_asset.current_quantity < 0:
-                    campaign_asset.current_quantity = 0
+            reverted[change.asset_id] -= change.quantity_change
+        adjust_pool_quantities(campaign_id, reverted)
+        discard_inventory_snapshots(campaign_id, event.event_date)
+        record_ledger_changes(campaign_id, mission_id, event.event_type, events=1, removed=True,
+                              quantity_changes=[change.quantity_change for change in event.asset_changes])
         
         # Delete the event (asset changes will cascade delete)
         db.session.delete(event)
+        bump_campaign_revision(campaign_id)
         db.session.commit()
         
         flash(f'Event "{event.title}" deleted successfully!', 'success')
@@ -531,6 +1186,7 @@ def add_asset_change():
     try:
         event_id = request.form['event_id']
         event = Event.query.get_or_404(event_id)
+        lock_campaign_ledger(event.mission.campaign_id)
         
         asset_change = AssetChange(
             event_id=event_id,
@@ -542,16 +1198,12 @@ def add_asset_change():
         db.session.add(asset_change)
         
         # Update campaign asset quantity
-        campaign_asset = CampaignAsset.query.filter_by(
-            campaign_id=event.mission.campaign_id,
-            asset_id=asset_change.asset_id
-        ).first()
-        
-        if campaign_asset:
-            campaign_asset.current_quantity += asset_change.quantity_change
-            if campaign_asset.current_quantity < 0:
-                campaign_asset.current_quantity = 0
+        adjust_pool_quantity(event.mission.campaign_id, asset_change.asset_id, asset_change.quantity_change)
+        discard_inventory_snapshots(event.mission.campaign_id, event.event_date)
+        record_ledger_changes(event.mission.campaign_id, event.mission_id, event.event_type,
+                              quantity_changes=[asset_change.quantity_change])
 
+        bump_campaign_revision(event.mission.campaign_id)
         db.session.commit()
         
         flash('Asset change added successfully!', 'success')
@@ -593,19 +1245,16 @@ def delete_asset_change():
         change = AssetChange.query.get_or_404(change_id)
         event = change.event
         mission_id = event.mission_id
+        lock_campaign_ledger(event.mission.campaign_id)
         
         # Revert the asset change in campaign asset
-        campaign_asset = CampaignAsset.query.filter_by(
-            campaign_id=event.mission.campaign_id,
-            asset_id=change.asset_id
-        ).first()
-        
-        if campaign_asset:
-            campaign_asset.current_quantity -= change.quantity_change
-            if campaign_asset.current_quantity < 0:
-                campaign_asset.current_quantity = 0
+        adjust_pool_quantity(event.mission.campaign_id, change.asset_id, -change.quantity_change)
+        discard_inventory_snapshots(event.mission.campaign_id, event.event_date)
+        record_ledger_changes(event.mission.campaign_id, mission_id, event.event_type,
+                              quantity_changes=[change.quantity_change], removed=True)
         
         db.session.delete(change)
+        bump_campaign_revision(event.mission.campaign_id)
         db.session.commit()
         
         flash('Asset change removed successfully!', 'success')
@@ -615,114 +1264,207 @@ def delete_asset_change():
         flash(f'Error removing asset change: {str(e)}', 'error')
         return redirect(url_for('main.mission_events', mission_id=mission_id))
 
-@main.route('/admin/campaign/<int:campaign_id>/report')
+def parse_batch_event(entry):
+    """
+    Validate one entry of an asset-change batch.
+
+    Returns (event_fields, changes) where event_fields is None for entries that
+    add changes to an existing event. Raises ValueError with a message for the caller.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError('entry must be an object')
+    raw_changes = entry.get('asset_changes') or []
+    if not isinstance(raw_changes, list) or not raw_changes:
+        raise ValueError('asset_changes must be a non-empty list')
+
+    changes = []
+    for change in raw_changes:
+        try:
+            asset_id = int(change['asset_id'])
+            quantity_change = int(change['quantity_change'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('each asset change needs an integer asset_id and quantity_change')
+        if quantity_change == 0:
+            raise ValueError(f'asset {asset_id}: quantity_change must not be 0')
+        changes.append({'asset_id': asset_id, 'quantity_change': quantity_change,
+                        'notes': change.get('notes', '')})
+
+    if entry.get('event_id') is not None:
+        try:
+            return {'id': int(entry['event_id'])}, changes
+        except (TypeError, ValueError):
+            raise ValueError('event_id must be an integer')
+
+    if not entry.get('title'):
+        raise ValueError('title is required')
+    if entry.get('event_type') not in EVENT_TYPES:
+        raise ValueError(f'event_type must be one of {", ".join(EVENT_TYPES)}')
+    try:
+        mission_id = int(entry['mission_id'])
+        event_date = datetime.fromisoformat(entry['event_date'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('mission_id and an ISO event_date (YYYY-MM-DDTHH:MM) are required')
+    # Stored dates are naive UTC at the event form's minute precision
+    if event_date.tzinfo is not None:
+        event_date = event_date.astimezone(timezone.utc).replace(tzinfo=None)
+    event_date = event_date.replace(second=0, microsecond=0)
+    return {
+        'mission_id': mission_id,
+        'title': entry['title'],
+        'event_type': entry['event_type'],
+        'event_date': event_date,
+        'description': entry.get('description', ''),
+        'location': entry.get('location', ''),
+        'notes': entry.get('notes', '')
+    }, changes
+
+@main.route('/api/campaign/<int:campaign_id>/asset-changes/batch', methods=['POST'])
 @login_required
-def generate_campaign_report(campaign_id):
+def batch_asset_changes(campaign_id):
+    """Record many events and their asset changes in one request"""
     if not current_user.is_manager:
         return jsonify({'error': 'Unauthorized'}), 403
-    
-    campaign = Campaign.query.get_or_404(campaign_id)
-    report_data = generate_report_data(campaign)
-    
-    # Create CSV response
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['Asset Name', 'Asset Type', 'Initial Quantity', 'Current Quantity', 'Net Change'])
-    
-    # Write data
-    for item in report_data['asset_history']:
-        writer.writerow([
-            item['asset_name'],
-            item['asset_type'],
-            item['initial_quantity'],
-            item['current_quantity'],
-            item['net_change']
-        ])
-    
-    output.seek(0)
-    
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = f'attachment; filename=campaign_{campaign_id}_report.csv'
-    response.headers['Content-type'] = 'text/csv'
-    
-    return response
 
-def generate_report_data(campaign):
-    """Generate report data for a campaign"""
-    campaign_assets = CampaignAsset.query.filter_by(campaign_id=campaign.id).all()
-    missions = Mission.query.filter_by(campaign_id=campaign.id).all()
-    
-    asset_history = []
-    for ca in campaign_assets:
-        asset_history.append({
-            'asset_name': ca.asset.name,
-            'asset_type': ca.asset.type,
-            'initial_quantity': ca.initial_quantity,
-            'current_quantity': ca.current_quantity,
-            'net_change': ca.current_quantity - ca.initial_quantity
-        })
-    
-    return {
-        'campaign': {
-            'name': campaign.name,
-            'description': campaign.description,
-            'start_date': campaign.start_date.isoformat() if campaign.start_date else None,
-            'end_date': campaign.end_date.isoformat() if campaign.end_date else None,
-            'is_closed': campaign.is_closed
-        },
-        'missions_count': len(missions),
-        'asset_history': asset_history
-    }
+    Campaign.query.get_or_404(campaign_id)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'request body must be a JSON object'}), 400
+    entries = data.get('events')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'success': False, 'error': 'events must be a non-empty list'}), 400
+
+    results = [None] * len(entries)
+    parsed = []
+    for index, entry in enumerate(entries):
+        try:
+            parsed.append((index,) + parse_batch_event(entry))
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+
+    limit = current_app.config['ASSET_CHANGE_BATCH_LIMIT']
+    if sum(len(changes) for _, _, changes in parsed) > limit:
+        return jsonify({'success': False, 'error': f'A batch may contain at most {limit} asset changes'}), 400
+
+    lock_campaign_ledger(campaign_id)
+    
+    # One lookup each for the referenced missions, existing events and pool entries
+    mission_ids = {fields['mission_id'] for _, fields, _ in parsed if 'mission_id' in fields}
+    event_ids = {fields['id'] for _, fields, _ in parsed if 'id' in fields}
+    asset_ids = {change['asset_id'] for _, _, changes in parsed for change in changes}
+    known_missions = {row.id for row in db.session.query(Mission.id).filter(
+        Mission.campaign_id == campaign_id, Mission.id.in_(mission_ids))} if mission_ids else set()
+    known_events = {row.id: row for row in db.session.query(Event.id, Event.event_date, Event.mission_id, Event.event_type).join(Mission).filter(
+        Mission.campaign_id == campaign_id, Event.id.in_(event_ids))} if event_ids else {}
+    pool_assets = {row.asset_id for row in db.session.query(CampaignAsset.asset_id).filter(
+        CampaignAsset.campaign_id == campaign_id, CampaignAsset.asset_id.in_(asset_ids))} if asset_ids else set()
+
+    accepted = []
+    for index, fields, changes in parsed:
+        missing = sorted({change['asset_id'] for change in changes} - pool_assets)
+        if 'id' in fields and fields['id'] not in known_events:
+            error = f'event {fields["id"]} is not part of this campaign'
+        elif 'mission_id' in fields and fields['mission_id'] not in known_missions:
+            error = f'mission {fields["mission_id"]} is not part of this campaign'
+        elif missing:
+            error = f'assets not in the campaign pool: {", ".join(map(str, missing))}'
+        else:
+            accepted.append((index, fields, changes))
+            continue
+        results[index] = {'index': index, 'status': 'error', 'error': error}
 
-def generate_final_report(campaign):
-    """Generate comprehensive final report for archiving"""
-    report = generate_report_data(campaign)
-    
-    # Add detailed mission and event history
-    missions = Mission.query.filter_by(campaign_id=campaign.id).all()
-    detailed_missions = []
-    
-    for mission in missions:
-        mission_data = {
-            'name': mission.name,
-            'date': mission.mission_date.isoformat() if mission.mission_date else None,
-            'description': mission.description,
-            'events': []
-        }
-        
-        for event in mission.events:
-            event_data = {
-                'type': event.event_type,
-                'description': event.description,
-                'date': event.event_date.isoformat(),
-                'notes': event.notes,
-                'asset_changes': []
-            }
-            
-            for change in event.asset_changes:
-                event_data['asset_changes'].append({
-                    'asset_name': change.asset.name,
-                    'quantity_change': change.quantity_change,
-                    'notes': change.notes
-                })
-            
-            mission_data['events'].append(event_data)
-        
-        detailed_missions.append(mission_data)
+    try:
+        new_events = {index: Event(**fields) for index, fields, _ in accepted if 'id' not in fields}
+        db.session.add_all(new_events.values())
+        db.session.flush()  # Assign event IDs
+
+        rows = []
+        quantity_changes = {}
+        ledger = []
+        for index, fields, changes in accepted:
+            event_id = new_events[index].id if index in new_events else fields['id']
+            for change in changes:
+                rows.append(dict(change, event_id=event_id))
+                quantity_changes[change['asset_id']] = quantity_changes.get(change['asset_id'], 0) + change['quantity_change']
+            results[index] = {'index': index, 'status': 'created' if index in new_events else 'updated',
+                              'event_id': event_id, 'asset_changes': len(changes)}
+            event = new_events.get(index) or known_events[fields['id']]
+            ledger.append((event.mission_id, event.event_type, int(index in new_events),
+                           [change['quantity_change'] for change in changes]))
+
+        if rows:
+            db.session.execute(db.insert(AssetChange), rows)
+            adjust_pool_quantities(campaign_id, quantity_changes)
+            discard_inventory_snapshots(campaign_id, min(
+                fields['event_date'] if index in new_events else known_events[fields['id']].event_date
+                for index, fields, _ in accepted
+            ))
+            bump_campaign_revision(campaign_id)
+        record_ledger_batch(campaign_id, ledger)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    return jsonify({
+        'success': len(accepted) == len(entries),
+        'events_created': len(new_events),
+        'asset_changes': len(rows),
+        'errors': len(entries) - len(accepted),
+        'results': results
+    })
+
+@main.route('/api/campaign/<int:campaign_id>/inventory')
+@login_required
+def campaign_inventory(campaign_id):
+    """Pool quantities at a past point in time (?as_of=YYYY-MM-DD[THH:MM] or ?mission=<id>)"""
+    if not current_user.is_manager:
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    report['detailed_missions'] = detailed_missions
+    Campaign.query.get_or_404(campaign_id)
+    mission_id = request.args.get('mission', type=int)
+    if mission_id:
+        # Going into the mission: everything dated before its mission day
+        mission = Mission.query.filter_by(id=mission_id, campaign_id=campaign_id).first_or_404()
+        as_of = datetime.combine(mission.mission_date, time.min)
+    else:
+        try:
+            value = request.args['as_of']
+            # A bare date means the end of that day
+            as_of = datetime.strptime(value, '%Y-%m-%d') + timedelta(days=1) if len(value) == 10 else datetime.fromisoformat(value)
+        except (KeyError, ValueError):
+            abort(400)
+        # Ledger dates are naive UTC
+        if as_of.tzinfo is not None:
+            as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    # Keep a snapshot at every mission boundary so as-of queries only replay a short tail
+    try:
+        if snapshot_mission_boundaries(campaign_id):
+            db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # A concurrent request took the same snapshots
     
-    # Add logs
-    logs = Log.query.filter_by(campaign_id=campaign.id).all()
-    report['logs'] = [{
-        'action': log.action,
-        'details': log.details,
-        'created_at': log.created_at.isoformat() if log.created_at else None
-    } for log in logs]
+    return jsonify({
+        'campaign_id': campaign_id,
+        'mission_id': mission_id,
+        'as_of': as_of.isoformat(),
+        'assets': inventory_as_of(campaign_id, as_of)
+    })
+
+@main.route('/admin/campaign/<int:campaign_id>/report')
+@login_required
+def generate_campaign_report(campaign_id):
+    if not current_user.is_manager:
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    return report
+    Campaign.query.get_or_404(campaign_id)
+    return csv_download(iter_pool_csv(campaign_id), f'campaign_{campaign_id}_report.csv')
+
+def csv_download(lines, filename):
+    """Stream CSV lines to the client as an attachment, rows being fetched as they are sent"""
+    response = Response(stream_with_context(iter_chunks(lines)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
 
 @main.route('/admin/assets', methods=['GET', 'POST'])
 @login_required
@@ -768,6 +1510,7 @@ def edit_asset():
         asset.description = request.form.get('description', '')
         asset.is_unique = request.form.get('is_unique') == 'true'
         
+        bump_campaign_revision(*campaign_ids_using_asset(asset.id))
         db.session.commit()
         flash(f'Asset "{asset.name}" updated successfully!', 'success')
     except Exception as e:
@@ -828,31 +1571,20 @@ def manage_campaigns():
             db.session.add(campaign)
             db.session.flush()
             
-            # Import selected libraries
-            library_ids = request.form.getlist('import_libraries')
+            # Import selected libraries, copying each one's assets with a single INSERT ... SELECT
+            library_ids = [int(lib_id) for lib_id in request.form.getlist('import_libraries')]
             if library_ids:
-                for lib_id in library_ids:
-                    library = AssetLibrary.query.get(lib_id)
-                    if library:
-                        # Create import record
-                        library_import = CampaignLibraryImport(
-                            campaign_id=campaign.id,
-                            library_id=library.id
-                        )
-                        db.session.add(library_import)
-                        
-                        # Import all assets from library
-                        for asset in library.assets:
-                            campaign_asset = CampaignAsset(
-                                campaign_id=campaign.id,
-                                asset_id=asset.id,
-                                library_id=library.id,
-                                initial_quantity=asset.default_quantity,
-                                current_quantity=asset.default_quantity
-                            )
-                            db.session.add(campaign_asset)
+                libraries = AssetLibrary.query.filter(AssetLibrary.id.in_(library_ids)).all()
+                db.session.add_all([
+                    CampaignLibraryImport(campaign_id=campaign.id, library_id=library.id) for library in libraries
+                ])
+                db.session.flush()
+                for library in libraries:
+                    add_missing_library_assets(library.id, campaign.id)
             
             db.session.commit()
+            if set_as_active:
+                invalidate_active_campaign()
             flash(f'Campaign "{campaign.name}" created successfully!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -887,6 +1619,7 @@ def set_campaign_active():
         campaign = Campaign.query.get_or_404(campaign_id)
         campaign.is_active = True
         db.session.commit()
+        invalidate_active_campaign()
         
         flash(f'Campaign "{campaign.name}" is now active', 'success')
         
@@ -925,40 +1658,27 @@ def close_campaign():
         campaign.is_active = False
         campaign.end_date = datetime.utcnow().date()
         
-        # Generate final report (simplified for now)
-        import json
-        import os
-        
-        report_data = {
-            'campaign': {
-                'name': campaign.name,
-                'description': campaign.description,
-                'start_date': campaign.start_date.isoformat() if campaign.start_date else None,
-                'end_date': campaign.end_date.isoformat() if campaign.end_date else None,
-                'status': 'closed'
-            },
-            'closed_at': datetime.utcnow().isoformat()
-        }
+        db.session.commit()
+        invalidate_active_campaign()
         
-        # Save report
-        os.makedirs('/app/reports', exist_ok=True)
+        # The final report covers the whole campaign history, so it is written off the request thread
         report_filename = f"campaign_{campaign.id}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
-        report_path = f"/app/reports/{report_filename}"
+        if current_app.config['REPORTS_GZIP']:
+            report_filename += '.gz'
+        job_id = report_jobs.submit(archive_final_report, campaign.id, report_filename,
+                                    campaign_id=campaign.id, filename=report_filename)
         
-        with open(report_path, 'w') as f:
-            json.dump(report_data, f, indent=2, default=str)
-        
-        db.session.commit()
-        
-        flash(f'Campaign "{campaign.name}" closed successfully. Report saved.', 'success')
+        flash(f'Campaign "{campaign.name}" closed successfully. The final report is being generated.', 'success')
         
         # Check if this is an AJAX request
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.accept_mimetypes.accept_json:
             return jsonify({
                 'success': True,
                 'message': f'Campaign "{campaign.name}" closed successfully',
-                'report': report_filename
-            })
+                'report': report_filename,
+                'report_job': job_id,
+                'status_url': url_for('main.report_job_status', job_id=job_id)
+            }), 202
         else:
             return redirect(url_for('main.manage_campaigns'))
             
@@ -988,29 +1708,9 @@ def campaign_detail(campaign_id):
             flash('Managers can only access the active campaign.', 'error')
             return redirect(url_for('main.admin_dashboard'))
     
-    # Get all available libraries
-    all_libraries = AssetLibrary.query.order_by(AssetLibrary.name).all()
-    
-    # Get imported libraries
-    imported_library_ids = [imp.library_id for imp in campaign.imported_libraries]
-    imported_libraries = AssetLibrary.query.filter(AssetLibrary.id.in_(imported_library_ids)).all() if imported_library_ids else []
-    
-    # Get assets in campaign grouped by library
-    campaign_assets = CampaignAsset.query.filter_by(campaign_id=campaign_id).all()
-    assets_by_library = {}
-    for ca in campaign_assets:
-        lib_name = ca.library.name
-        if lib_name not in assets_by_library:
-            assets_by_library[lib_name] = []
-        assets_by_library[lib_name].append(ca)
-    
     return render_template('admin/campaign_detail.html',
                          campaign=campaign,
-                         all_libraries=all_libraries,
-                         imported_libraries=imported_libraries,
-                         imported_library_ids=imported_library_ids,
-                         campaign_assets=campaign_assets,
-                         assets_by_library=assets_by_library)
+                         **load_campaign_pool(campaign_id))
 
 @main.route('/admin/campaign/<int:campaign_id>/add-asset', methods=['POST'])
 @login_required
@@ -1023,6 +1723,7 @@ def add_asset_to_campaign(campaign_id):
         data = request.get_json()
         asset_id = data['asset_id']
         quantity = data.get('quantity', 1)
+        lock_campaign_ledger(campaign_id)
         
         # Check if asset already in campaign
         existing = CampaignAsset.query.filter_by(
@@ -1046,6 +1747,8 @@ def add_asset_to_campaign(campaign_id):
         )
         
         db.session.add(campaign_asset)
+        refresh_pool_rollups(campaign_id)
+        bump_campaign_revision(campaign_id)
         db.session.commit()
         
         return jsonify({'success': True, 'id': campaign_asset.id})
@@ -1065,12 +1768,17 @@ def update_asset_quantity():
         quantity = data['quantity']
         
         campaign_asset = CampaignAsset.query.get_or_404(library_id)
+        lock_campaign_ledger(campaign_asset.campaign_id)
         
-        # Update both initial and current quantities
-        diff = quantity - campaign_asset.initial_quantity
-        campaign_asset.initial_quantity = quantity
-        campaign_asset.current_quantity += diff
+        # Update both initial and current quantities in one statement, so the
+        # difference is taken against the stored values rather than a stale read
+        CampaignAsset.query.filter_by(id=campaign_asset.id).update({
+            CampaignAsset.initial_quantity: quantity,
+            CampaignAsset.current_quantity: CampaignAsset.current_quantity + quantity - CampaignAsset.initial_quantity
+        }, synchronize_session=False)
         
+        refresh_pool_rollups(campaign_asset.campaign_id)
+        bump_campaign_revision(campaign_asset.campaign_id)
         db.session.commit()
         return jsonify({'success': True})
     except Exception as e:
@@ -1088,7 +1796,10 @@ def remove_asset_from_campaign():
         library_id = data['library_id']
         
         campaign_asset = CampaignAsset.query.get_or_404(library_id)
+        lock_campaign_ledger(campaign_asset.campaign_id)
         db.session.delete(campaign_asset)
+        refresh_pool_rollups(campaign_asset.campaign_id)
+        bump_campaign_revision(campaign_asset.campaign_id)
         db.session.commit()
         
         return jsonify({'success': True})
@@ -1111,6 +1822,7 @@ def toggle_asset_visibility():
         # Toggle the visibility
         asset.show_in_public = not asset.show_in_public
         
+        bump_campaign_revision(*campaign_ids_using_asset(asset.id))
         db.session.commit()
         
         return jsonify({
@@ -1201,6 +1913,9 @@ def add_asset_to_library(library_id):
             flash(f'Asset "{asset.name}" added successfully! Synced to {sync_result["campaigns_updated"]} campaign(s).', 'success')
         else:
             flash(f'Asset "{asset.name}" added successfully!', 'success')
+    except IntegrityError:
+        db.session.rollback()
+        flash(f'An asset named "{request.form["name"]}" already exists in this library.', 'error')
     except Exception as e:
         flash(f'Error adding asset: {str(e)}', 'error')
     
@@ -1231,6 +1946,9 @@ def edit_library_asset(library_id, asset_id):
         sync_library_to_campaigns(library_id)
         
         flash(f'Asset "{asset.name}" updated successfully!', 'success')
+    except IntegrityError:
+        db.session.rollback()
+        flash(f'An asset named "{request.form["name"]}" already exists in this library.', 'error')
     except Exception as e:
         flash(f'Error updating asset: {str(e)}', 'error')
     
@@ -1248,10 +1966,17 @@ def delete_library_asset(library_id):
         asset_id = request.form.get('asset_id')
         asset = Asset.query.filter_by(id=asset_id, library_id=library_id).first_or_404()
         
-        # Check if asset is used in any campaigns
+        # Assets used in campaigns are retired instead, and each campaign's
+        # removal policy decides on the next sync whether to flag or drop them
         campaigns_using = CampaignAsset.query.filter_by(asset_id=asset_id).count()
         if campaigns_using > 0:
-            flash(f'Cannot delete "{asset.name}". It is used in {campaigns_using} campaign(s).', 'error')
+            if asset.retired_at:
+                flash(f'"{asset.name}" is already retired. It is still used in {campaigns_using} campaign(s).', 'info')
+            else:
+                asset.retired_at = datetime.utcnow()
+                db.session.commit()
+                sync_library_to_campaigns(library_id)
+                flash(f'"{asset.name}" is used in {campaigns_using} campaign(s), so it was retired instead of deleted.', 'warning')
         else:
             asset_name = asset.name
             db.session.delete(asset)
@@ -1307,36 +2032,22 @@ def import_library_to_campaign(campaign_id):
             flash('Library already imported to this campaign.', 'warning')
             return redirect(url_for('main.campaign_detail', campaign_id=campaign_id))
         
+        library = AssetLibrary.query.get_or_404(library_id)
+        
         # Create import record
         library_import = CampaignLibraryImport(
             campaign_id=campaign_id,
             library_id=library_id
         )
         db.session.add(library_import)
+        db.session.flush()
         
-        # Import all assets from the library
-        library = AssetLibrary.query.get_or_404(library_id)
-        assets = Asset.query.filter_by(library_id=library_id).all()
-        
-        for asset in assets:
-            # Check if asset already in campaign
-            existing_asset = CampaignAsset.query.filter_by(
-                campaign_id=campaign_id,
-                asset_id=asset.id
-            ).first()
-            
-            if not existing_asset:
-                campaign_asset = CampaignAsset(
-                    campaign_id=campaign_id,
-                    asset_id=asset.id,
-                    library_id=library_id,
-                    initial_quantity=asset.default_quantity,
-                    current_quantity=asset.default_quantity
-                )
-                db.session.add(campaign_asset)
+        # Import the library's assets that are not in the pool yet, in one statement
+        assets_added = add_missing_library_assets(library_id, campaign_id)[campaign_id]
         
+        bump_campaign_revision(campaign_id)
         db.session.commit()
-        flash(f'Library "{library.name}" imported successfully! Added {len(assets)} assets.', 'success')
+        flash(f'Library "{library.name}" imported successfully! Added {assets_added} assets.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error importing library: {str(e)}', 'error')
@@ -1365,37 +2076,33 @@ def sync_library_to_campaign(campaign_id, library_id):
         
         library = AssetLibrary.query.get_or_404(library_id)
         
-        # Get all assets from the library
-        library_assets = Asset.query.filter_by(library_id=library_id).all()
-        assets_added = 0
+        if request.form.get('dry_run'):
+            preview = sync_library_to_campaigns(library_id, campaign_id, dry_run=True)
+            if not preview['success']:
+                raise RuntimeError(preview['error'])
+            flash(f'Sync preview for "{library.name}": {preview["assets_added"]} to add, '
+                  f'{preview["quantities_updated"]} quantity change(s), {preview["assets_removed"]} to remove, '
+                  f'{preview["assets_flagged"]} retired asset(s) flagged.', 'info')
+            return redirect(url_for('main.campaign_detail', campaign_id=campaign_id))
         
-        for asset in library_assets:
-            # Check if asset already exists in campaign
-            existing_asset = CampaignAsset.query.filter_by(
-                campaign_id=campaign_id,
-                asset_id=asset.id
-            ).first()
-            
-            if not existing_asset:
-                # Add new asset to campaign
-                campaign_asset = CampaignAsset(
-                    campaign_id=campaign_id,
-                    asset_id=asset.id,
-                    library_id=library_id,
-                    initial_quantity=asset.default_quantity,
-                    current_quantity=asset.default_quantity
-                )
-                db.session.add(campaign_asset)
-                assets_added += 1
-        
-        # Update last_synced_at timestamp
-        library_import.last_synced_at = datetime.utcnow()
+        sync_result = sync_library_to_campaigns(library_id, campaign_id)
+        if not sync_result['success']:
+            raise RuntimeError(sync_result['error'])
+        
+        # A manual sync also restores older library assets missing from the pool
+        restored = add_missing_library_assets(library_id, campaign_id)[campaign_id]
+        if restored:
+            bump_campaign_revision(campaign_id)
         db.session.commit()
+        assets_added = sync_result['assets_added'] + restored
         
-        if assets_added > 0:
-            flash(f'Library "{library.name}" synced successfully! Added {assets_added} new asset(s).', 'success')
+        if assets_added or sync_result['quantities_updated'] or sync_result['assets_removed']:
+            flash(f'Library "{library.name}" synced successfully! Added {assets_added} new asset(s), '
+                  f'updated {sync_result["quantities_updated"]} quantity(ies), removed {sync_result["assets_removed"]}.', 'success')
         else:
             flash(f'Library "{library.name}" is already up to date.', 'info')
+        if sync_result['assets_flagged']:
+            flash(f'{sync_result["assets_flagged"]} pool asset(s) were retired from the library and kept in the campaign.', 'warning')
             
     except Exception as e:
         db.session.rollback()
@@ -1403,6 +2110,39 @@ def sync_library_to_campaign(campaign_id, library_id):
     
     return redirect(url_for('main.campaign_detail', campaign_id=campaign_id))
 
+@main.route('/admin/campaign/<int:campaign_id>/library/<int:library_id>/removal-policy', methods=['POST'])
+@login_required
+def set_library_removal_policy(campaign_id, library_id):
+    """Choose what syncing does with assets retired from an imported library"""
+    if not current_user.is_manager:
+        flash('Access denied. Manager login required.', 'error')
+        return redirect(url_for('main.index'))
+    
+    library_import = CampaignLibraryImport.query.filter_by(
+        campaign_id=campaign_id,
+        library_id=library_id
+    ).first_or_404()
+    policy = request.form.get('removal_policy')
+    if policy not in REMOVAL_POLICIES:
+        flash('Unknown removal policy.', 'error')
+    else:
+        library_import.removal_policy = policy
+        db.session.commit()
+        flash(f'Retired assets from "{library_import.library.name}" will now be {"removed" if policy == "remove" else "flagged"} on sync.', 'success')
+    
+    return redirect(url_for('main.campaign_detail', campaign_id=campaign_id))
+
+@main.route('/api/libraries/<int:library_id>/sync-plan')
+@login_required
+def library_sync_plan(library_id):
+    """Dry-run diff of what syncing a library would change in each importing campaign"""
+    if not current_user.is_manager:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    AssetLibrary.query.get_or_404(library_id)
+    preview = sync_library_to_campaigns(library_id, request.args.get('campaign', type=int), dry_run=True)
+    return jsonify(preview), 200 if preview['success'] else 400
+
 @main.route('/admin/reports')
 @login_required
 def reports_dashboard():
@@ -1414,26 +2154,33 @@ def reports_dashboard():
     # Get all campaigns
     campaigns = Campaign.query.order_by(Campaign.created_at.desc()).all()
     
-    # Check for existing report files
-    import os
-    reports_dir = '/app/reports'
-    report_files = []
-    if os.path.exists(reports_dir):
-        for filename in os.listdir(reports_dir):
-            if filename.endswith('.json'):
-                filepath = os.path.join(reports_dir, filename)
-                file_stat = os.stat(filepath)
-                report_files.append({
-                    'filename': filename,
-                    'size': file_stat.st_size,
-                    'created': datetime.fromtimestamp(file_stat.st_ctime)
-                })
-    
-    report_files.sort(key=lambda x: x['created'], reverse=True)
+    # Archived reports come from the index rather than a scan of the reports directory,
+    # newest first and one page at a time; ?before= is the "<created_at>_<id>" of the last row shown
+    query = ReportArchive.query
+    if request.args.get('before'):
+        try:
+            cursor_date, cursor_id = request.args['before'].rsplit('_', 1)
+            before_date, before_id = datetime.strptime(cursor_date, '%Y%m%d%H%M%S%f'), int(cursor_id)
+        except ValueError:
+            abort(400)
+        query = query.filter(db.or_(
+            ReportArchive.created_at < before_date,
+            db.and_(ReportArchive.created_at == before_date, ReportArchive.id < before_id)
+        ))
+    
+    page_size = current_app.config['REPORTS_PAGE_SIZE']
+    report_files = query.order_by(ReportArchive.created_at.desc(), ReportArchive.id.desc()).limit(page_size + 1).all()
+    next_cursor = None
+    if len(report_files) > page_size:
+        report_files = report_files[:page_size]
+        last = report_files[-1]
+        next_cursor = f"{last.created_at.strftime('%Y%m%d%H%M%S%f')}_{last.id}"
     
     return render_template('admin/reports.html', 
                          campaigns=campaigns,
-                         report_files=report_files)
+                         report_files=report_files,
+                         report_count=db.session.query(db.func.count(ReportArchive.id)).scalar(),
+                         next_cursor=next_cursor)
 
 
 @main.route('/admin/campaign/<int:campaign_id>/report/view')
@@ -1445,64 +2192,16 @@ def view_campaign_report(campaign_id):
     
     campaign = Campaign.query.get_or_404(campaign_id)
     
-    # Get report data
-    campaign_assets = CampaignAsset.query.filter_by(campaign_id=campaign.id).all()
-    missions = Mission.query.filter_by(campaign_id=campaign.id).order_by(Mission.mission_date).all()
-    
-    # Calculate statistics
-    total_initial = sum(ca.initial_quantity for ca in campaign_assets)
-    total_current = sum(ca.current_quantity for ca in campaign_assets)
-    total_change = total_current - total_initial
-    
-    # Asset statistics by type
-    asset_types = {}
-    for ca in campaign_assets:
-        asset_type = ca.asset.type
-        if asset_type not in asset_types:
-            asset_types[asset_type] = {
-                'count': 0,
-                'initial': 0,
-                'current': 0,
-                'assets': []
-            }
-        asset_types[asset_type]['count'] += 1
-        asset_types[asset_type]['initial'] += ca.initial_quantity
-        asset_types[asset_type]['current'] += ca.current_quantity
-        asset_types[asset_type]['assets'].append(ca)
-    
-    # Mission statistics
-    mission_stats = {
-        'total': len(missions),
-        'completed': len([m for m in missions if m.status == 'completed']),
-        'in_progress': len([m for m in missions if m.status == 'in_progress']),
-        'planned': len([m for m in missions if m.status == 'planned']),
-        'cancelled': len([m for m in missions if m.status == 'cancelled'])
-    }
-    
-    # Event statistics
-    total_events = 0
-    event_types = {}
-    total_asset_changes = 0
-    
-    for mission in missions:
-        total_events += len(mission.events)
-        for event in mission.events:
-            event_type = event.event_type
-            event_types[event_type] = event_types.get(event_type, 0) + 1
-            total_asset_changes += len(event.asset_changes)
+    # Statistics come from the rollup and aggregate queries; only the inventory table needs the pool rows themselves
+    statistics = campaign_statistics(campaign.id)
+    campaign_assets = CampaignAsset.query.filter_by(campaign_id=campaign.id).options(
+        joinedload(CampaignAsset.asset)
+    ).order_by(CampaignAsset.id).all()
     
     return render_template('admin/report_view.html',
                          campaign=campaign,
                          campaign_assets=campaign_assets,
-                         missions=missions,
-                         total_initial=total_initial,
-                         total_current=total_current,
-                         total_change=total_change,
-                         asset_types=asset_types,
-                         mission_stats=mission_stats,
-                         total_events=total_events,
-                         event_types=event_types,
-                         total_asset_changes=total_asset_changes)
+                         **statistics)
 
 
 @main.route('/admin/campaign/<int:campaign_id>/report/download/<format>')
@@ -1517,12 +2216,13 @@ def download_campaign_report(campaign_id, format):
     if format == 'csv':
         return generate_campaign_report(campaign_id)
     
+    elif format == 'ledger':
+        return csv_download(iter_ledger_csv(campaign_id), f'campaign_{campaign_id}_ledger.csv')
+    
     elif format == 'json':
-        report_data = generate_final_report(campaign)
-        
-        response = make_response(json.dumps(report_data, indent=2))
+        report = iter_chunks(iter_json(generate_final_report(campaign)))
+        response = Response(stream_with_context(report), mimetype='application/json')
         response.headers['Content-Disposition'] = f'attachment; filename=campaign_{campaign_id}_report.json'
-        response.headers['Content-type'] = 'application/json'
         return response
     
     else:
@@ -1537,7 +2237,7 @@ def download_report_file(filename):
     if not current_user.is_manager:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    reports_dir = os.path.abspath('/app/reports')
+    reports_dir = os.path.abspath(current_app.config['REPORTS_DIR'])
     filepath = os.path.abspath(os.path.join(reports_dir, filename))
     
     # Ensure the resolved path is within the reports directory to prevent path traversal
@@ -1545,11 +2245,40 @@ def download_report_file(filename):
         flash('Report file not found', 'error')
         return redirect(url_for('main.reports_dashboard'))
     
-    if os.path.exists(filepath):
-        return send_file(filepath, as_attachment=True)
-    else:
+    archive = ReportArchive.query.filter_by(filename=filename).first()
+    if archive is None or not os.path.exists(filepath):
         flash('Report file not found', 'error')
         return redirect(url_for('main.reports_dashboard'))
+    
+    if not archive.compressed:
+        return send_file(filepath, as_attachment=True, etag=archive.sha256)
+    
+    # Compressed reports are sent as stored to clients that accept gzip and decompressed for the rest
+    download_name = filename[:-len('.gz')]
+    if 'gzip' in request.accept_encodings:
+        response = send_file(filepath, mimetype='application/json', as_attachment=True,
+                             download_name=download_name, etag=archive.sha256)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(iter_gunzip(filepath), mimetype='application/json')
+        response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@main.route('/admin/reports/jobs/<job_id>')
+@login_required
+def report_job_status(job_id):
+    """Poll the status of a background final-report job"""
+    if not current_user.is_manager:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    job = report_jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown report job'}), 404
+    
+    if job['status'] == 'done':
+        job['download_url'] = url_for('main.download_report_file', filename=job['filename'])
+    return jsonify(job)
 
 @main.route('/admin/libraries/<int:library_id>/import-assets', methods=['POST'])
 @login_required
@@ -1567,40 +2296,34 @@ def import_assets_to_library(library_id):
             flash('No assets selected for import.', 'warning')
             return redirect(url_for('main.library_detail', library_id=library_id))
         
-        imported_count = 0
-        skipped_count = 0
+        # Fetch the source rows and the names already in this library in one query each
+        source_assets = Asset.query.filter(Asset.id.in_([int(asset_id) for asset_id in asset_ids])).order_by(Asset.id).all()
+        taken = {name_key for (name_key,) in db.session.query(Asset.name_key).filter_by(library_id=library_id)}
         
-        for asset_id in asset_ids:
-            source_asset = Asset.query.get(asset_id)
-            if not source_asset:
+        copies = []
+        for source_asset in source_assets:
+            name_key = normalize_asset_name(source_asset.name)
+            if name_key in taken:
                 continue
-            
-            # Check if asset with same name already exists in this library
-            existing = Asset.query.filter_by(
-                library_id=library_id,
-                name=source_asset.name
-            ).first()
-            
-            if existing:
-                skipped_count += 1
-                continue
-            
-            # Create a copy of the asset in this library
-            new_asset = Asset(
-                library_id=library_id,
-                name=source_asset.name,
-                type=source_asset.type,
-                category=source_asset.category,
-                description=source_asset.description,
-                default_quantity=source_asset.default_quantity,
-                is_unique=source_asset.is_unique,
-                show_in_public=source_asset.show_in_public
-            )
-            
-            db.session.add(new_asset)
-            imported_count += 1
+            taken.add(name_key)
+            copies.append({
+                'library_id': library_id,
+                'name': source_asset.name,
+                'name_key': name_key,
+                'type': source_asset.type,
+                'category': source_asset.category,
+                'description': source_asset.description,
+                'default_quantity': source_asset.default_quantity,
+                'is_unique': source_asset.is_unique,
+                'show_in_public': source_asset.show_in_public
+            })
         
+        # Copy in one bulk INSERT; the (library_id, name_key) unique index catches concurrent imports
+        if copies:
+            db.session.execute(db.insert(Asset), copies)
         db.session.commit()
+        imported_count = len(copies)
+        skipped_count = len(source_assets) - imported_count
         
         if imported_count > 0:
             flash(f'Successfully imported {imported_count} asset(s) to "{library.name}".', 'success')
@@ -1609,11 +2332,170 @@ def import_assets_to_library(library_id):
         
         return redirect(url_for('main.library_detail', library_id=library_id))
         
+    except IntegrityError:
+        db.session.rollback()
+        flash('Some of these assets were added to the library meanwhile. Please try the import again.', 'error')
+        return redirect(url_for('main.library_detail', library_id=library_id))
     except Exception as e:
         db.session.rollback()
         flash(f'Error importing assets: {str(e)}', 'error')
         return redirect(url_for('main.library_detail', library_id=library_id))
 
+def iter_asset_upload(upload):
+    """
+    Yield (line_number, row) from an uploaded CSV or JSON-lines file.
+
+    The file is read one line at a time, so large catalogs never sit in memory
+    whole. Rows that are not valid JSON are yielded as None.
+    """
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    if (upload.filename or '').lower().endswith(('.jsonl', '.ndjson')):
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, None
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+def parse_upload_flag(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+
+def parse_asset_upload_row(row):
+    """Turn one uploaded row into Asset column values, raising ValueError if it is unusable."""
+    if not isinstance(row, dict):
+        raise ValueError('not a valid row')
+    row = {str(key or '').strip().lower(): value for key, value in row.items()}
+    
+    name = str(row.get('name') or row.get('classname') or '').strip()
+    asset_type = str(row.get('type') or '').strip()
+    if not name or not asset_type:
+        raise ValueError('name and type are required')
+    if len(name) > 200 or len(asset_type) > 50:
+        raise ValueError('name or type is too long')
+    default_quantity = row.get('default_quantity')
+    if isinstance(default_quantity, str):
+        default_quantity = default_quantity.strip()
+    try:
+        default_quantity = 1 if default_quantity in (None, '') else int(default_quantity)
+    except (TypeError, ValueError):
+        raise ValueError('default_quantity must be a whole number')
+    if default_quantity < 0:
+        raise ValueError('default_quantity must not be negative')
+    
+    return {
+        'name': name,
+        'type': asset_type,
+        'category': str(row.get('category') or '').strip() or None,
+        'description': str(row.get('description') or '').strip() or None,
+        'default_quantity': default_quantity,
+        'is_unique': parse_upload_flag(row.get('is_unique'), False),
+        'show_in_public': parse_upload_flag(row.get('show_in_public'), True)
+    }
+
+def upsert_asset_batch(library_id, rows):
+    """
+    Insert or update one batch of parsed rows, matching existing assets by normalised name.
+
+    Later rows win over earlier ones with the same name. Rows identical to the
+    stored asset are skipped. Returns (inserted, updated, skipped).
+    """
+    by_key = {}
+    for row in rows:
+        by_key[normalize_asset_name(row['name'])] = row
+    existing = {asset.name_key: asset for asset in Asset.query.filter(
+        Asset.library_id == library_id,
+        Asset.name_key.in_(by_key)
+    )}
+    
+    inserts, updates = [], []
+    for name_key, row in by_key.items():
+        asset = existing.get(name_key)
+        if asset is None:
+            inserts.append(dict(row, library_id=library_id, name_key=name_key))
+        elif any(getattr(asset, field) != value for field, value in row.items()):
+            update = dict(row, id=asset.id, updated_at=datetime.utcnow())
+            if asset.default_quantity != row['default_quantity']:
+                update['quantity_updated_at'] = update['updated_at']
+            updates.append(update)
+    
+    if inserts:
+        db.session.execute(db.insert(Asset), inserts)
+    if updates:
+        db.session.execute(db.update(Asset), updates)  # Bulk UPDATE by primary key
+    return len(inserts), len(updates), len(rows) - len(inserts) - len(updates)
+
+@main.route('/admin/libraries/<int:library_id>/upload-assets', methods=['POST'])
+@login_required
+def upload_assets_to_library(library_id):
+    """Add or update library assets from a CSV or JSON-lines file"""
+    wants_json = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    if not current_user.is_manager:
+        if wants_json:
+            return jsonify({'error': 'Unauthorized'}), 403
+        flash('Access denied. Manager login required.', 'error')
+        return redirect(url_for('main.manage_libraries'))
+    
+    library = AssetLibrary.query.get_or_404(library_id)
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        if wants_json:
+            return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+        flash('Choose a CSV or JSON-lines file to upload.', 'warning')
+        return redirect(url_for('main.library_detail', library_id=library_id))
+    
+    # Validate and upsert in fixed-size batches, one transaction each
+    batch_size = current_app.config['ASSET_UPLOAD_BATCH_SIZE']
+    stats = {'success': True, 'inserted': 0, 'updated': 0, 'skipped': 0, 'invalid': 0, 'errors': []}
+    batch = []
+    
+    def flush_batch():
+        inserted, updated, skipped = upsert_asset_batch(library_id, batch)
+        db.session.commit()
+        stats['inserted'] += inserted
+        stats['updated'] += updated
+        stats['skipped'] += skipped
+        batch.clear()
+    
+    try:
+        for line_number, row in iter_asset_upload(upload):
+            try:
+                batch.append(parse_asset_upload_row(row))
+            except ValueError as e:
+                stats['invalid'] += 1
+                if len(stats['errors']) < UPLOAD_ERRORS_REPORTED:
+                    stats['errors'].append(f'Line {line_number}: {e}')
+                continue
+            if len(batch) >= batch_size:
+                flush_batch()
+        if batch:
+            flush_batch()
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        stats.update(success=False, error=f'Could not read the file after {stats["inserted"] + stats["updated"]} saved row(s): {e}')
+    
+    if stats['inserted'] or stats['updated']:
+        sync_library_to_campaigns(library_id)
+    
+    if wants_json:
+        return jsonify(stats), 200 if stats['success'] else 400
+    
+    if not stats['success']:
+        flash(stats['error'], 'error')
+    flash(f'Upload to "{library.name}": {stats["inserted"]} added, {stats["updated"]} updated, '
+          f'{stats["skipped"]} skipped, {stats["invalid"]} invalid.', 'success' if stats['success'] else 'warning')
+    for error in stats['errors']:
+        flash(error, 'warning')
+    return redirect(url_for('main.library_detail', library_id=library_id))
+
 @main.route('/manager')
 @login_required
 def manager_dashboard():
@@ -1627,7 +2509,7 @@ def manager_dashboard():
         return redirect(url_for('main.admin_dashboard'))
     
     # Get active campaign
-    active_campaign = Campaign.query.filter_by(is_active=True, is_closed=False).first()
+    active_campaign = get_active_campaign()
     
     if not active_campaign:
         return render_template('manager/dashboard.html', 
@@ -1636,36 +2518,28 @@ def manager_dashboard():
                              recent_events=[],
                              asset_summary={})
     
-    # Get campaign assets
-    campaign_assets = CampaignAsset.query.filter_by(campaign_id=active_campaign.id).all()
-    
     # Get missions
     missions = Mission.query.filter_by(campaign_id=active_campaign.id).order_by(Mission.mission_date.desc()).limit(5).all()
     
-    # Get recent events
-    recent_events = []
-    for mission in Mission.query.filter_by(campaign_id=active_campaign.id).all():
-        for event in mission.events:
-            recent_events.append({
-                'mission': mission.name,
-                'title': event.title,
-                'date': event.event_date,
-                'type': event.event_type
-            })
-    recent_events.sort(key=lambda x: x['date'], reverse=True)
-    recent_events = recent_events[:10]
+    # Get recent events, newest first; ?recent=N and ?type= narrow the widget
+    recent_limit = max(1, min(request.args.get('recent', current_app.config['RECENT_EVENTS_LIMIT'], type=int), 100))
+    recent_type = request.args.get('type') if request.args.get('type') in EVENT_TYPES else None
+    recent_events = query_recent_events(active_campaign.id, recent_limit, recent_type)
     
-    # Asset summary
+    # Asset summary, read from the campaign rollup
+    rollup = load_campaign_rollup(active_campaign.id)
     asset_summary = {
-        'total': len(campaign_assets),
-        'low_stock': len([ca for ca in campaign_assets if ca.current_quantity < 3 and ca.current_quantity > 0]),
-        'depleted': len([ca for ca in campaign_assets if ca.current_quantity == 0])
+        'total': rollup.asset_count,
+        'low_stock': rollup.low_stock_count,
+        'depleted': rollup.depleted_count
     }
     
     return render_template('manager/dashboard.html', 
                          campaign=active_campaign,
                          missions=missions,
                          recent_events=recent_events,
+                         recent_type=recent_type,
+                         event_types=EVENT_TYPES,
                          asset_summary=asset_summary)
 
 
@@ -1680,35 +2554,15 @@ def manager_campaign():
     if current_user.is_admin:
         return redirect(url_for('main.admin_dashboard'))
     
-    active_campaign = Campaign.query.filter_by(is_active=True, is_closed=False).first()
+    active_campaign = get_active_campaign()
     
     if not active_campaign:
         flash('No active campaign found.', 'warning')
         return redirect(url_for('main.manager_dashboard'))
     
-    # Get all available libraries
-    all_libraries = AssetLibrary.query.order_by(AssetLibrary.name).all()
-    
-    # Get imported libraries
-    imported_library_ids = [imp.library_id for imp in active_campaign.imported_libraries]
-    imported_libraries = AssetLibrary.query.filter(AssetLibrary.id.in_(imported_library_ids)).all() if imported_library_ids else []
-    
-    # Get assets in campaign grouped by library
-    campaign_assets = CampaignAsset.query.filter_by(campaign_id=active_campaign.id).all()
-    assets_by_library = {}
-    for ca in campaign_assets:
-        lib_name = ca.library.name
-        if lib_name not in assets_by_library:
-            assets_by_library[lib_name] = []
-        assets_by_library[lib_name].append(ca)
-    
     return render_template('manager/campaign.html',
                          campaign=active_campaign,
-                         all_libraries=all_libraries,
-                         imported_libraries=imported_libraries,
-                         imported_library_ids=imported_library_ids,
-                         campaign_assets=campaign_assets,
-                         assets_by_library=assets_by_library)
+                         **load_campaign_pool(active_campaign.id))
 
 
 @main.route('/manager/missions')
@@ -1722,24 +2576,24 @@ def manager_missions():
     if current_user.is_admin:
         return redirect(url_for('main.admin_dashboard'))
     
-    active_campaign = Campaign.query.filter_by(is_active=True, is_closed=False).first()
+    active_campaign = get_active_campaign()
     
     if not active_campaign:
         flash('No active campaign found.', 'warning')
         return redirect(url_for('main.manager_dashboard'))
     
-    missions = Mission.query.filter_by(campaign_id=active_campaign.id).order_by(Mission.order_index).all()
+    missions, mission_events, change_counts = load_mission_overview(active_campaign.id, Mission.order_index)
     
     # Get max order index for new mission
-    max_order = db.session.query(db.func.max(Mission.order_index)).filter_by(
-        campaign_id=active_campaign.id
-    ).scalar() or 0
+    max_order = max((mission.order_index or 0 for mission in missions), default=0)
     
     today = datetime.now().strftime('%Y-%m-%d')
     
     return render_template('manager/missions.html', 
                          campaign=active_campaign, 
                          missions=missions,
+                         mission_events=mission_events,
+                         change_counts=change_counts,
                          max_order=max_order,
                          today=today)
 
@@ -7,8 +7,23 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from app import create_app
 import unittest
 from flask import url_for
-from app import create_app, db
-from app.models import User, Campaign, Asset, Mission, Event, CampaignAsset
+from app import create_app, db, page_cache, report_jobs
+from app.reports import campaign_statistics, iter_json, write_final_report
+from app.rollups import event_type_counts, load_campaign_rollup, mission_rollup_figures, rebuild_rollups, record_ledger_changes, refresh_pool_rollups, remove_mission_from_rollups
+from app.routes import adjust_pool_quantity, bump_campaign_revision, get_active_campaign, inventory_as_of, query_recent_events, sync_library_to_campaigns
+from app.models import User, Campaign, Asset, Mission, Event, CampaignAsset, AssetChange, AssetLibrary, CampaignLibraryImport, InventorySnapshot, Log, ReportArchive, CampaignRollup, MissionRollup
+from contextlib import contextmanager
+import csv
+import gzip
+import hashlib
+import io
+import json
+import re
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from sqlalchemy import event as sa_event
+from sqlalchemy.exc import IntegrityError
 
 class TestRoutes(unittest.TestCase):
     def setUp(self):
@@ -178,5 +193,1356 @@ class TestRoutes(unittest.TestCase):
             self.assertTrue(user.check_password('password'))
 
 
+
+@contextmanager
+def count_queries(engine):
+    """Count the SQL statements executed on engine inside the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sa_event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        sa_event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+CAMPAIGN_LOCK = re.compile(r'SELECT campaign\.id AS campaign_id\s+FROM campaign\s+WHERE campaign\.id IN')
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Base class running against the in-memory testing configuration."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def create_campaign(self, is_active=True):
+        campaign = Campaign(name='Operation Test', is_active=is_active)
+        library = AssetLibrary(name=f'Library {Campaign.query.count()}')
+        db.session.add_all([campaign, library])
+        db.session.commit()
+        return campaign, library
+
+    def seed_campaign(self, campaign, library, assets=5, missions=3, events=2):
+        """Add assets to the pool and missions with events that change them."""
+        pool = []
+        offset = Asset.query.filter_by(library_id=library.id).count()
+        for i in range(assets):
+            asset = Asset(library_id=library.id, name=f'Asset {library.id}-{offset + i}',
+                          type='Vehicle', default_quantity=10, show_in_public=(i % 5 != 0))
+            db.session.add(asset)
+            db.session.flush()
+            db.session.add(CampaignAsset(campaign_id=campaign.id, asset_id=asset.id, library_id=library.id,
+                                         initial_quantity=10, current_quantity=10))
+            pool.append(asset)
+        for m in range(missions):
+            mission = Mission(campaign_id=campaign.id, name=f'Mission {m}',
+                              mission_date=date(2024, 1, 1) + timedelta(days=m), order_index=m)
+            db.session.add(mission)
+            db.session.flush()
+            for e in range(events):
+                event = Event(mission_id=mission.id, event_type='combat', title=f'Contact {m}-{e}',
+                              event_date=datetime(2024, 1, 1, 12) + timedelta(days=m, hours=e))
+                db.session.add(event)
+                db.session.flush()
+                for asset in pool[:3]:
+                    db.session.add(AssetChange(event_id=event.id, asset_id=asset.id, quantity_change=-1))
+        bump_campaign_revision(campaign.id)
+        db.session.commit()
+        return pool
+
+    def import_library(self, library, campaigns, synced_at=datetime(2000, 1, 1)):
+        """Import library into campaigns, last synced before any of its assets were added."""
+        db.session.add_all([CampaignLibraryImport(campaign_id=c.id, library_id=library.id, last_synced_at=synced_at)
+                            for c in campaigns])
+        db.session.commit()
+
+    def login_as(self, username='manager', is_admin=False):
+        user = User(username=username, is_manager=True, is_admin=is_admin)
+        user.set_password('password')
+        db.session.add(user)
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+            sess['_fresh'] = True
+        return user
+
+
+class TestPublicDashboardQueries(DatabaseTestCase):
+    def test_index_lists_only_public_assets(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=5)
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Asset 1-1', response.data)
+        self.assertNotIn(b'Asset 1-0<', response.data)
+
+    def test_index_query_count_is_constant(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=3, missions=1, events=1)
+        with count_queries(db.engine) as small:
+            self.client.get('/')
+
+        self.seed_campaign(campaign, library, assets=40, missions=12, events=4)
+        with count_queries(db.engine) as large:
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(small), len(large))
+
+
+
+class TestPublicPageCache(DatabaseTestCase):
+    def test_repeat_request_is_served_from_cache(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library)
+        self.client.get('/')
+        with count_queries(db.engine) as statements:
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(page_cache.hits, 1)
+        self.assertEqual(len(statements), 1)  # Only the active campaign lookup
+
+    def test_asset_change_bumps_revision_and_refreshes_pool(self):
+        campaign, library = self.create_campaign()
+        pool = self.seed_campaign(campaign, library, assets=2, missions=1, events=1)
+        event_id = Event.query.first().id
+        before = self.client.get('/api/current-pool').get_json()
+        revision = campaign.revision
+
+        self.login_as()
+        self.client.post('/admin/asset-change/add', data={
+            'event_id': event_id, 'asset_id': pool[1].id, 'quantity_change': -4
+        })
+
+        self.assertEqual(db.session.get(Campaign, campaign.id).revision, revision + 1)
+        after = self.client.get('/api/current-pool').get_json()
+        quantities = {row['name']: row['current_quantity'] for row in after}
+        self.assertEqual(quantities[pool[1].name], {r['name']: r['current_quantity'] for r in before}[pool[1].name] - 4)
+
+
+
+class TestConditionalGet(DatabaseTestCase):
+    def test_unchanged_pool_poll_is_not_modified(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library)
+        first = self.client.get('/api/current-pool')
+        self.assertIsNotNone(first.headers.get('ETag'))
+        self.assertIsNotNone(first.headers.get('Last-Modified'))
+
+        with count_queries(db.engine) as statements:
+            second = self.client.get('/api/current-pool', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 304)
+        self.assertFalse(any('campaign_asset' in statement for statement in statements))
+
+    def test_changed_campaign_invalidates_etag(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library)
+        first = self.client.get('/')
+        bump_campaign_revision(campaign.id)
+        db.session.commit()
+        second = self.client.get('/', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(first.headers['ETag'], second.headers['ETag'])
+
+    def test_not_modified_page_keeps_cached_csp(self):
+        campaign, library = self.create_campaign()
+        first = self.client.get('/')
+        second = self.client.get('/', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 304)
+        self.assertNotIn('Content-Security-Policy', second.headers)
+
+
+
+class TestTimelinePagination(DatabaseTestCase):
+    def test_cursor_pages_cover_every_event_once_newest_first(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=3, missions=4, events=3)
+        seen = []
+        cursor = None
+        while True:
+            query = {'limit': 5}
+            if cursor:
+                query['cursor'] = cursor
+            page = self.client.get('/api/timeline', query_string=query).get_json()
+            seen.extend(page['events'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 12)
+        self.assertEqual(len({event['id'] for event in seen}), 12)
+        dates = [event['date'] for event in seen]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    def test_cursor_keeps_events_within_the_same_second(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=3, missions=1, events=0)
+        mission = Mission.query.first()
+        db.session.add_all([Event(mission_id=mission.id, event_type='logistics', title=f'Logged {i}',
+                                  event_date=datetime(2024, 1, 1, 12, 0, 0, 250000 * i)) for i in range(4)])
+        db.session.commit()
+        seen, cursor = [], None
+        while True:
+            page = self.client.get('/api/timeline', query_string={'limit': 1, 'cursor': cursor or ''}).get_json()
+            seen.extend(event['title'] for event in page['events'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, [f'Mission 0: Logged {i}' for i in (3, 2, 1, 0)])
+
+    def test_limit_is_clamped(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=3, missions=2, events=2)
+        page = self.client.get('/api/timeline', query_string={'limit': -2}).get_json()
+        self.assertEqual(len(page['events']), 1)
+        self.assertIsNotNone(page['next_cursor'])
+
+    def test_filters_by_mission_and_date(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=3, missions=3, events=2)
+        mission = Mission.query.filter_by(name='Mission 1').first()
+        page = self.client.get('/api/timeline', query_string={'mission': mission.id}).get_json()
+        self.assertEqual({event['mission_id'] for event in page['events']}, {mission.id})
+
+        page = self.client.get('/api/timeline', query_string={'from': '2024-01-03', 'to': '2024-01-03'}).get_json()
+        self.assertEqual(len(page['events']), 2)
+        self.assertEqual(self.client.get('/api/timeline?cursor=bogus').status_code, 400)
+
+    def test_timeline_page_renders(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=3, missions=2, events=2)
+        response = self.client.get('/timeline', query_string={'type': 'combat'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Contact 1-1', response.data)
+
+    def test_cache_key_follows_the_parsed_filters(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=3, missions=2, events=2)
+        mission = Mission.query.filter_by(name='Mission 1').first()
+        for query in ({'mission': mission.id, 'from': '2024-01-02'},
+                      {'mission': f'{mission.id}', 'from': '2024-1-2', 'utm_source': 'discord'},
+                      {'from': '2024-01-02', 'type': '', 'mission': mission.id}):
+            self.client.get('/api/timeline', query_string=query)
+            response = self.client.get('/timeline', query_string=query)
+        self.assertEqual(len(page_cache), 2)
+        self.assertIn(b'value="2024-01-02"', response.data)
+
+
+class TestRecentEvents(DatabaseTestCase):
+    def test_newest_events_limited_and_filtered(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=3, missions=4, events=3)
+        mission = Mission.query.filter_by(name='Mission 0').first()
+        db.session.add(Event(mission_id=mission.id, event_type='logistics', title='Resupply',
+                             event_date=datetime(2024, 1, 2, 9)))
+        db.session.commit()
+
+        events = query_recent_events(campaign.id, limit=5)
+        self.assertEqual([event['title'] for event in events],
+                         ['Contact 3-2', 'Contact 3-1', 'Contact 3-0', 'Contact 2-2', 'Contact 2-1'])
+        self.assertEqual(events[0]['mission'], 'Mission 3')
+        self.assertEqual([event['title'] for event in query_recent_events(campaign.id, event_type='logistics')],
+                         ['Resupply'])
+
+        self.login_as()
+        response = self.client.get('/manager', query_string={'recent': -2})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Contact 3-2', response.data)
+        self.assertNotIn(b'Contact 3-1', response.data)
+
+    def test_dashboard_query_count_does_not_grow_with_missions(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=3, missions=2, events=2)
+        self.login_as()
+
+        def dashboard_queries():
+            self.client.get('/manager')
+            with count_queries(db.engine) as statements:
+                response = self.client.get('/manager', query_string={'recent': 3, 'type': 'combat'})
+            self.assertEqual(response.status_code, 200)
+            return len(statements), response
+
+        small, response = dashboard_queries()
+        self.assertIn(b'Contact 1-1', response.data)
+        self.assertNotIn(b'Contact 0-0', response.data)
+        self.seed_campaign(campaign, library, assets=3, missions=20, events=2)
+        self.assertEqual(dashboard_queries()[0], small)
+
+
+class TestMissionsPages(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.campaign, self.library = self.create_campaign()
+        self.seed_campaign(self.campaign, self.library, assets=3, missions=2, events=2)
+
+    def page_queries(self, url):
+        self.client.get(url)
+        with count_queries(db.engine) as statements:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(statements), response
+
+    def assert_query_count_constant(self, url):
+        small, response = self.page_queries(url)
+        self.assertIn(b'Events (2)', response.data)
+        self.assertIn(b'6 asset changes', response.data)
+        self.seed_campaign(self.campaign, self.library, assets=3, missions=10, events=4)
+        self.assertEqual(self.page_queries(url)[0], small)
+
+    def test_admin_page_query_count_does_not_grow(self):
+        self.login_as(is_admin=True)
+        self.assert_query_count_constant(f'/admin/campaign/{self.campaign.id}/missions')
+
+    def test_manager_page_query_count_does_not_grow(self):
+        self.login_as()
+        self.assert_query_count_constant('/manager/missions')
+
+    def test_mission_events_page_query_count_does_not_grow(self):
+        self.login_as()
+        mission = Mission.query.filter_by(name='Mission 0').first()
+        url = f'/admin/mission/{mission.id}/events'
+        small, response = self.page_queries(url)
+        self.assertIn(b'Asset 1-0 (10 available)', response.data)
+
+        pool = self.seed_campaign(self.campaign, self.library, assets=10, missions=1, events=1)
+        for e in range(5):
+            event = Event(mission_id=mission.id, event_type='logistics', title=f'Resupply {e}',
+                          event_date=datetime(2024, 1, 1, 18, e))
+            db.session.add(event)
+            db.session.flush()
+            db.session.add_all([AssetChange(event_id=event.id, asset_id=asset.id, quantity_change=2) for asset in pool])
+        db.session.commit()
+        count, response = self.page_queries(url)
+        self.assertEqual(count, small)
+        self.assertIn(b'Resupply 4', response.data)
+
+    def test_events_listed_in_date_order(self):
+        mission = Mission.query.filter_by(name='Mission 0').first()
+        db.session.add(Event(mission_id=mission.id, event_type='training', title='Briefing',
+                             event_date=datetime(2024, 1, 1, 8)))
+        db.session.commit()
+        self.login_as(is_admin=True)
+        page = self.client.get(f'/admin/campaign/{self.campaign.id}/missions').get_data(as_text=True)
+        self.assertLess(page.index('Briefing'), page.index('Contact 0-0'))
+        self.assertLess(page.index('Contact 0-0'), page.index('Contact 0-1'))
+
+
+class TestCampaignPoolPages(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.campaign, self.library = self.create_campaign()
+        self.seed_campaign(self.campaign, self.library, assets=3, missions=1, events=1)
+        self.import_library(self.library, [self.campaign])
+
+    def page_queries(self, url):
+        self.client.get(url)
+        with count_queries(db.engine) as statements:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(statements), response
+
+    def grow_catalog(self):
+        other = AssetLibrary(name='Other Library')
+        db.session.add(other)
+        db.session.commit()
+        self.seed_campaign(self.campaign, self.library, assets=20, missions=0)
+        self.seed_campaign(self.campaign, other, assets=20, missions=0)
+        db.session.add_all([Asset(library_id=other.id, name=f'Spare {i}', type='Vehicle') for i in range(30)])
+        db.session.commit()
+
+    def test_detail_page_query_count_does_not_grow_with_catalog(self):
+        self.login_as(is_admin=True)
+        url = f'/admin/campaign/{self.campaign.id}'
+        small, response = self.page_queries(url)
+        self.assertIn(b'3 assets in library', response.data)
+        self.grow_catalog()
+        count, response = self.page_queries(url)
+        self.assertEqual(count, small)
+        self.assertIn(b'23 assets in library', response.data)
+        self.assertIn(b'- 50 assets', response.data)
+
+    def test_manager_page_groups_pool_by_library(self):
+        self.login_as()
+        small, _ = self.page_queries('/manager/campaign')
+        self.grow_catalog()
+        count, response = self.page_queries('/manager/campaign')
+        self.assertEqual(count, small)
+        page = response.get_data(as_text=True)
+        self.assertLess(page.index(self.library.name), page.index('Other Library'))
+        self.assertIn('Asset 2-0', page)
+
+
+class TestSchemaConstraints(DatabaseTestCase):
+    def test_campaign_asset_is_unique_per_campaign(self):
+        campaign, library = self.create_campaign()
+        asset = self.seed_campaign(campaign, library, assets=1, missions=0)[0]
+        db.session.add(CampaignAsset(campaign_id=campaign.id, asset_id=asset.id, library_id=library.id))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_pool_lookup_uses_index(self):
+        plan = db.session.execute(db.text(
+            'EXPLAIN QUERY PLAN SELECT * FROM campaign_asset WHERE campaign_id = 1 AND asset_id = 1'
+        )).all()
+        self.assertIn('USING INDEX', ' '.join(row[-1] for row in plan))
+
+    def test_library_assets_use_the_composite_indexes(self):
+        self.assertNotIn('ix_asset_library_id', {index.name for index in Asset.__table__.indexes})
+        plan = db.session.execute(db.text('EXPLAIN QUERY PLAN SELECT * FROM asset WHERE library_id = 1')).all()
+        self.assertIn('USING INDEX', ' '.join(row[-1] for row in plan))
+
+
+
+class TestActiveCampaignResolver(DatabaseTestCase):
+    def test_resolver_is_cached_until_active_campaign_changes(self):
+        first, _ = self.create_campaign()
+        second, _ = self.create_campaign(is_active=False)
+        self.assertEqual(get_active_campaign().id, first.id)
+        with count_queries(db.engine) as statements:
+            self.assertEqual(get_active_campaign().id, first.id)
+        self.assertEqual(statements, [])
+
+        self.login_as('admin', is_admin=True)
+        self.client.post('/admin/campaign/set-active', data={'campaign_id': second.id})
+        self.assertEqual(get_active_campaign().id, second.id)
+
+    def test_public_pages_notice_campaign_closed_elsewhere(self):
+        campaign, _ = self.create_campaign()
+        self.assertIsNotNone(get_active_campaign())
+        campaign.is_closed = True
+        db.session.commit()
+        self.assertIsNone(get_active_campaign(with_revision=True))
+
+
+class TestAssetChangeBatch(DatabaseTestCase):
+    def batch_payload(self, mission, pool, events=2):
+        return {'events': [
+            {'mission_id': mission.id, 'title': f'AAR {i}', 'event_type': 'logistics',
+             'event_date': f'2024-02-0{i + 1}T18:00',
+             'asset_changes': [{'asset_id': asset.id, 'quantity_change': -2} for asset in pool]}
+            for i in range(events)
+        ]}
+
+    def test_batch_records_events_and_applies_net_quantities(self):
+        campaign, library = self.create_campaign()
+        pool = self.seed_campaign(campaign, library, assets=3, missions=1, events=0)
+        mission = Mission.query.filter_by(campaign_id=campaign.id).first()
+        self.login_as()
+
+        response = self.client.post(f'/api/campaign/{campaign.id}/asset-changes/batch',
+                                    json=self.batch_payload(mission, pool))
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertTrue(body['success'])
+        self.assertEqual((body['events_created'], body['asset_changes']), (2, 6))
+        self.assertEqual([row['status'] for row in body['results']], ['created', 'created'])
+        self.assertEqual(AssetChange.query.count(), 6)
+        quantities = {ca.asset_id: ca.current_quantity for ca in CampaignAsset.query.all()}
+        self.assertEqual(quantities, {asset.id: 6 for asset in pool})
+
+    def test_invalid_rows_are_reported_without_blocking_the_rest(self):
+        campaign, library = self.create_campaign()
+        pool = self.seed_campaign(campaign, library, assets=2, missions=1, events=1)
+        other, other_library = self.create_campaign(is_active=False)
+        stranger = self.seed_campaign(other, other_library, assets=1, missions=0)[0]
+        event = Event.query.first()
+        self.login_as()
+
+        response = self.client.post(f'/api/campaign/{campaign.id}/asset-changes/batch', json={'events': [
+            {'event_id': event.id, 'asset_changes': [{'asset_id': pool[1].id, 'quantity_change': 4}]},
+            {'event_id': event.id, 'asset_changes': [{'asset_id': stranger.id, 'quantity_change': 1}]},
+            {'mission_id': event.mission_id, 'title': 'Bad', 'event_type': 'parade',
+             'event_date': '2024-02-01T18:00', 'asset_changes': [{'asset_id': pool[0].id, 'quantity_change': 1}]},
+        ]})
+        body = response.get_json()
+        self.assertFalse(body['success'])
+        self.assertEqual([row['status'] for row in body['results']], ['updated', 'error', 'error'])
+        self.assertIn(str(stranger.id), body['results'][1]['error'])
+        self.assertEqual(CampaignAsset.query.filter_by(asset_id=pool[1].id).one().current_quantity, 14)
+
+    def test_dates_normalised_and_non_object_bodies_rejected(self):
+        campaign, library = self.create_campaign()
+        pool = self.seed_campaign(campaign, library, assets=1, missions=1, events=0)
+        mission = Mission.query.filter_by(campaign_id=campaign.id).first()
+        self.login_as()
+        url = f'/api/campaign/{campaign.id}/asset-changes/batch'
+
+        payload = self.batch_payload(mission, pool, events=1)
+        payload['events'][0]['event_date'] = '2024-02-01T20:30:45.123456+02:00'
+        self.assertEqual(self.client.post(url, json=payload).status_code, 200)
+        self.assertEqual(Event.query.one().event_date, datetime(2024, 2, 1, 18, 30))
+
+        for body in ([payload], 'events', 3):
+            self.assertEqual(self.client.post(url, json=body).status_code, 400)
+
+    def test_batch_query_count_is_constant(self):
+        campaign, library = self.create_campaign()
+        pool = self.seed_campaign(campaign, library, assets=10, missions=1, events=0)
+        mission = Mission.query.filter_by(campaign_id=campaign.id).first()
+        self.login_as()
+        url = f'/api/campaign/{campaign.id}/asset-changes/batch'
+
+        small_batch = self.batch_payload(mission, pool[:1], events=1)
+        large_batch = self.batch_payload(mission, pool, events=8)
+
+        with count_queries(db.engine) as small:
+            self.client.post(url, json=small_batch)
+        with count_queries(db.engine) as large:
+            self.client.post(url, json=large_batch)
+        self.assertEqual(AssetChange.query.count(), 81)
+        self.assertLessEqual(len(large), len(small) + 8)  # at most one INSERT per new event
+
+
+class TestAddEventForm(DatabaseTestCase):
+    def event_form(self, mission, assets, campaign_id=None, start=0):
+        form = {'mission_id': mission.id, 'campaign_id': campaign_id or mission.campaign_id,
+                'title': 'Convoy', 'event_type': 'logistics', 'event_date': '2024-02-01T18:00'}
+        for i, asset in enumerate(assets, start=start):
+            form[f'asset_changes[{i}][asset_id]'] = asset.id
+            form[f'asset_changes[{i}][quantity_change]'] = -1
+        return form
+
+    def test_campaign_comes_from_mission_not_form(self):
+        campaign, library = self.create_campaign()
+        pool = self.seed_campaign(campaign, library, assets=2, missions=1, events=0)
+        other, other_library = self.create_campaign(is_active=False)
+        self.seed_campaign(other, other_library, assets=1, missions=0)
+        mission = Mission.query.filter_by(campaign_id=campaign.id).one()
+        self.login_as()
+
+        self.client.post('/admin/event/add', data=self.event_form(mission, pool, campaign_id=other.id, start=3))
+        quantities = {ca.asset_id: ca.current_quantity for ca in CampaignAsset.query.filter_by(campaign_id=campaign.id)}
+        self.assertEqual(quantities, {asset.id: 9 for asset in pool})
+        self.assertEqual(AssetChange.query.count(), 2)
+
+    def test_query_count_does_not_grow_with_line_items(self):
+        campaign, library = self.create_campaign()
+        pool = self.seed_campaign(campaign, library, assets=20, missions=1, events=0)
+        mission = Mission.query.filter_by(campaign_id=campaign.id).one()
+        self.login_as()
+        small_form = self.event_form(mission, pool[:1])
+        large_form = self.event_form(mission, pool)
+
+        with count_queries(db.engine) as small:
+            self.client.post('/admin/event/add', data=small_form)
+        with count_queries(db.engine) as large:
+            self.client.post('/admin/event/add', data=large_form)
+        self.assertEqual(AssetChange.query.count(), 21)
+        self.assertEqual(len(large), len(small))
+
+
+class TestInventorySnapshots(DatabaseTestCase):
+    def quantities(self, campaign, **params):
+        response = self.client.get(f'/api/campaign/{campaign.id}/inventory', query_string=params)
+        self.assertEqual(response.status_code, 200)
+        return {row['asset_id']: row['quantity'] for row in response.get_json()['assets']}
+
+    def test_as_of_matches_full_replay(self):
+        campaign, library = self.create_campaign()
+        pool = self.seed_campaign(campaign, library, assets=4, missions=4, events=2)
+        self.login_as()
+
+        # Missions are a day apart, each event takes 1 from the first three assets
+        going_into_third = self.quantities(campaign, mission=Mission.query.filter_by(name='Mission 2').one().id)
+        self.assertEqual(InventorySnapshot.query.count(), 4)
+        self.assertEqual(going_into_third, {pool[0].id: 6, pool[1].id: 6, pool[2].id: 6, pool[3].id: 10})
+        self.assertEqual(self.quantities(campaign, as_of='2024-01-04'), {pool[0].id: 2, pool[1].id: 2, pool[2].id: 2, pool[3].id: 10})
+
+        # Without snapshots the same answer comes from replaying the whole ledger
+        InventorySnapshot.query.delete()
+        db.session.commit()
+        replayed = {row['asset_id']: row['quantity'] for row in inventory_as_of(campaign.id, datetime(2024, 1, 3))}
+        self.assertEqual(replayed, going_into_third)
+
+    def test_backdated_change_discards_later_snapshots(self):
+        campaign, library = self.create_campaign()
+        pool = self.seed_campaign(campaign, library, assets=2, missions=3, events=1)
+        self.login_as()
+        self.quantities(campaign, as_of='2024-01-01')
+        first_event = Event.query.order_by(Event.event_date).first()
+
+        self.client.post('/admin/asset-change/add', data={
+            'event_id': first_event.id, 'asset_id': pool[1].id, 'quantity_change': -5
+        })
+        self.assertEqual([s.as_of for s in InventorySnapshot.query.all()], [datetime(2024, 1, 1)])
+        self.assertEqual(self.quantities(campaign, as_of='2024-01-03T00:00')[pool[1].id], 3)
+        self.assertEqual(self.quantities(campaign, as_of='2024-01-03T02:00+02:00')[pool[1].id], 3)
+        self.assertEqual(self.client.get(f'/api/campaign/{campaign.id}/inventory',
+                                         query_string={'as_of': '2024-01-02T19:00-05:00'}).get_json()['as_of'],
+                         '2024-01-03T00:00:00')
+        self.assertEqual(InventorySnapshot.query.count(), 3)
+
+    def test_snapshot_writers_and_ledger_writes_share_the_campaign_lock(self):
+        campaign, library = self.create_campaign()
+        pool = self.seed_campaign(campaign, library, assets=2, missions=3, events=1)
+        self.login_as()
+        first_event = Event.query.order_by(Event.event_date).first()
+
+        def locks(request):
+            with count_queries(db.engine) as statements:
+                request()
+            return [statement for statement in statements
+                    if CAMPAIGN_LOCK.match(statement)]
+
+        self.assertEqual(len(locks(lambda: self.quantities(campaign, as_of='2024-01-02'))), 1)
+        self.assertEqual(locks(lambda: self.quantities(campaign, as_of='2024-01-02')), [])
+        self.assertTrue(locks(lambda: self.client.post('/admin/asset-change/add', data={
+            'event_id': first_event.id, 'asset_id': pool[1].id, 'quantity_change': -5})))
+
+    def test_as_of_requires_a_point_in_time(self):
+        campaign, _ = self.create_campaign()
+        self.login_as()
+        self.assertEqual(self.client.get(f'/api/campaign/{campaign.id}/inventory').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/campaign/{campaign.id}/inventory?as_of=soon').status_code, 400)
+
+
+class TestLibrarySync(DatabaseTestCase):
+    def test_sync_adds_only_missing_assets_per_campaign(self):
+        first, library = self.create_campaign()
+        second, _ = self.create_campaign(is_active=False)
+        pool = self.seed_campaign(first, library, assets=3, missions=0)
+        self.import_library(library, [first, second])
+
+        result = sync_library_to_campaigns(library.id)
+        self.assertEqual(result['assets_added'], 3)
+        self.assertEqual(result['campaigns'], [{'name': second.name, 'assets_added': 3}])
+        self.assertEqual(CampaignAsset.query.filter_by(campaign_id=first.id).count(), 3)
+        added = CampaignAsset.query.filter_by(campaign_id=second.id, asset_id=pool[0].id).one()
+        self.assertEqual((added.initial_quantity, added.current_quantity), (10, 10))
+        self.assertEqual(sync_library_to_campaigns(library.id)['assets_added'], 0)
+
+    def test_sync_statement_count_is_independent_of_library_size(self):
+        library = AssetLibrary(name='Shared')
+        campaigns = [Campaign(name=f'Op {i}') for i in range(4)]
+        db.session.add_all([library] + campaigns)
+        db.session.commit()
+        self.import_library(library, campaigns)
+
+        def add_assets(count):
+            db.session.add_all([Asset(library_id=library.id, name=f'Asset {Asset.query.count() + i}', type='Vehicle')
+                                for i in range(count)])
+            db.session.commit()
+
+        add_assets(1)
+        with count_queries(db.engine) as small:
+            sync_library_to_campaigns(library.id)
+        add_assets(50)
+        with count_queries(db.engine) as large:
+            result = sync_library_to_campaigns(library.id)
+        self.assertEqual(result['assets_added'], 200)
+        self.assertEqual(len(small), len(large))
+
+
+class TestBulkLibraryImport(DatabaseTestCase):
+    def add_library(self, name, assets):
+        library = AssetLibrary(name=name)
+        db.session.add(library)
+        db.session.flush()
+        db.session.add_all([Asset(library_id=library.id, name=f'{name} {i}', type='Vehicle', default_quantity=3)
+                            for i in range(assets)])
+        db.session.commit()
+        return library
+
+    def test_new_campaign_copies_selected_libraries(self):
+        self.login_as('admin', is_admin=True)
+        libraries = [self.add_library('Armor', 60), self.add_library('Infantry', 40)]
+        self.client.post('/admin/campaigns', data={'name': 'Op Large', 'import_libraries': [l.id for l in libraries]})
+
+        campaign = Campaign.query.filter_by(name='Op Large').one()
+        self.assertEqual(CampaignAsset.query.filter_by(campaign_id=campaign.id, current_quantity=3).count(), 100)
+        self.assertEqual(CampaignLibraryImport.query.filter_by(campaign_id=campaign.id).count(), 2)
+
+    def test_campaign_creation_statements_do_not_grow_with_library_size(self):
+        self.login_as('admin', is_admin=True)
+        small, large = self.add_library('Small', 1), self.add_library('Large', 200)
+
+        with count_queries(db.engine) as few:
+            self.client.post('/admin/campaigns', data={'name': 'Op Small', 'import_libraries': [small.id]})
+        with count_queries(db.engine) as many:
+            self.client.post('/admin/campaigns', data={'name': 'Op Large', 'import_libraries': [large.id]})
+        self.assertEqual(CampaignAsset.query.count(), 201)
+        self.assertEqual(len(many), len(few))
+
+    def test_import_skips_assets_already_in_pool(self):
+        campaign, library = self.create_campaign()
+        self.seed_campaign(campaign, library, assets=2, missions=0)
+        db.session.add(Asset(library_id=library.id, name='Late addition', type='Weapon', default_quantity=4))
+        db.session.commit()
+        self.login_as()
+
+        self.client.post(f'/admin/campaign/{campaign.id}/import-library', data={'library_id': library.id})
+        self.assertEqual(CampaignAsset.query.filter_by(campaign_id=campaign.id).count(), 3)
+        self.assertEqual(CampaignAsset.query.filter_by(campaign_id=campaign.id, initial_quantity=10).count(), 2)
+
+
+class TestLibraryAssetCopy(DatabaseTestCase):
+    def test_copy_skips_names_that_differ_only_in_case_or_spacing(self):
+        source, other, target = AssetLibrary(name='Source'), AssetLibrary(name='Other'), AssetLibrary(name='Target')
+        db.session.add_all([source, other, target])
+        db.session.flush()
+        copied = [Asset(library_id=source.id, name=name, type='Vehicle') for name in ('M1A2  Abrams', 'BTR-80', 'HMMWV')]
+        copied.append(Asset(library_id=other.id, name='btr-80 ', type='Vehicle'))
+        db.session.add_all(copied + [Asset(library_id=target.id, name='m1a2 abrams', type='Vehicle')])
+        db.session.commit()
+        self.login_as()
+
+        with count_queries(db.engine) as statements:
+            self.client.post(f'/admin/libraries/{target.id}/import-assets',
+                             data={'asset_ids': [asset.id for asset in copied]})
+        names = sorted(name for (name,) in db.session.query(Asset.name).filter_by(library_id=target.id))
+        self.assertEqual(names, ['BTR-80', 'HMMWV', 'm1a2 abrams'])
+        self.assertEqual(sum(statement.startswith('INSERT INTO asset') for statement in statements), 1)
+
+    def test_library_rejects_duplicate_normalised_names(self):
+        library = AssetLibrary(name='Library')
+        db.session.add(library)
+        db.session.flush()
+        db.session.add_all([Asset(library_id=library.id, name='T-72B', type='Vehicle'),
+                            Asset(library_id=library.id, name=' t-72b', type='Vehicle')])
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+
+
+class TestLibraryUpload(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.library = AssetLibrary(name='RHS')
+        db.session.add(self.library)
+        db.session.flush()
+        db.session.add(Asset(library_id=self.library.id, name='rhs_t72ba_tv', type='Vehicle', default_quantity=1))
+        db.session.commit()
+        self.login_as()
+
+    def upload(self, filename, content):
+        return self.client.post(f'/admin/libraries/{self.library.id}/upload-assets',
+                                data={'file': (io.BytesIO(content.encode()), filename)},
+                                headers={'X-Requested-With': 'XMLHttpRequest'})
+
+    def test_csv_rows_are_upserted_in_batches(self):
+        self.app.config['ASSET_UPLOAD_BATCH_SIZE'] = 2
+        response = self.upload('rhs.csv', (
+            'classname,type,default_quantity,show_in_public\n'
+            'RHS_T72BA_TV,Vehicle,4,no\n'
+            'rhs_bmp2,Vehicle,6,\n'
+            'rhs_weap_ak74m,Weapon,abc,\n'
+            'rhs_weap_ak74m,Weapon,20,\n'
+            ',Weapon,1,\n'
+            'rhs_bmp2,Vehicle,6,\n'
+        ))
+        stats = response.get_json()
+        self.assertEqual((stats['inserted'], stats['updated'], stats['skipped'], stats['invalid']), (2, 1, 1, 2))
+        self.assertEqual(stats['errors'][0], 'Line 4: default_quantity must be a whole number')
+        tank = Asset.query.filter_by(library_id=self.library.id, name_key='rhs_t72ba_tv').one()
+        self.assertEqual((tank.name, tank.default_quantity, tank.show_in_public), ('RHS_T72BA_TV', 4, False))
+        self.assertEqual(Asset.query.filter_by(library_id=self.library.id).count(), 3)
+
+    def test_backfill_command_uses_the_app_normalisation(self):
+        db.session.add(Asset(library_id=self.library.id, name=' Straße\u00a0 Patrol ', type='Vehicle'))
+        db.session.commit()
+        Asset.query.update({Asset.name_key: db.func.upper(Asset.name)})
+        db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=['backfill-name-keys'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Updated 2 name key(s), 0 clash(es) to resolve.', result.output)
+        db.session.expire_all()
+        self.assertEqual(sorted(asset.name_key for asset in Asset.query), ['rhs_t72ba_tv', 'strasse patrol'])
+        self.assertIn('Updated 0 name key(s)', self.app.test_cli_runner().invoke(args=['backfill-name-keys']).output)
+
+    def test_json_lines_upload(self):
+        lines = [{'name': f'cup_b_hmmwv_{i}', 'type': 'Vehicle', 'is_unique': i == 0} for i in range(5)]
+        response = self.upload('cup.jsonl', '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n')
+        stats = response.get_json()
+        self.assertEqual((stats['inserted'], stats['invalid']), (5, 1))
+        self.assertTrue(Asset.query.filter_by(name='cup_b_hmmwv_0').one().is_unique)
+
+    def test_explicit_zero_quantity_is_kept(self):
+        lines = [{'name': 'cup_zero', 'type': 'Vehicle', 'default_quantity': 0},
+                 {'name': 'cup_blank', 'type': 'Vehicle', 'default_quantity': ''}]
+        self.assertEqual(self.upload('cup.jsonl', '\n'.join(json.dumps(line) for line in lines)).get_json()['inserted'], 2)
+        self.upload('zero.csv', 'name,type,default_quantity\ncsv_zero,Weapon,0\ncsv_blank,Weapon, \n')
+        quantities = {asset.name: asset.default_quantity for asset in Asset.query.filter(Asset.name != 'rhs_t72ba_tv')}
+        self.assertEqual(quantities, {'cup_zero': 0, 'cup_blank': 1, 'csv_zero': 0, 'csv_blank': 1})
+
+    def test_statements_grow_with_batches_not_rows(self):
+        self.app.config['ASSET_UPLOAD_BATCH_SIZE'] = 100
+        rows = ''.join(f'ace_item_{i},Equipment\n' for i in range(300))
+        with count_queries(db.engine) as statements:
+            stats = self.upload('ace.csv', 'name,type\n' + rows).get_json()
+        self.assertEqual(stats['inserted'], 300)
+        self.assertEqual(sum(statement.startswith('INSERT INTO asset ') for statement in statements), 3)
+
+
+class TestStreamedReports(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.campaign, self.library = self.create_campaign()
+        self.login_as()
+
+    def read_csv(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+    def test_pool_csv_lists_every_pool_entry(self):
+        pool = self.seed_campaign(self.campaign, self.library, assets=4, missions=1, events=1)
+        CampaignAsset.query.filter_by(asset_id=pool[0].id).update({'current_quantity': 7})
+        db.session.commit()
+        rows = self.read_csv(f'/admin/campaign/{self.campaign.id}/report')
+        self.assertEqual(rows[0], ['Asset Name', 'Asset Type', 'Initial Quantity', 'Current Quantity', 'Net Change'])
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1], [pool[0].name, 'Vehicle', '10', '7', '-3'])
+
+    def test_ledger_csv_has_one_row_per_change_in_event_order(self):
+        self.seed_campaign(self.campaign, self.library, assets=3, missions=2, events=2)
+        rows = self.read_csv(f'/admin/campaign/{self.campaign.id}/report/download/ledger')
+        self.assertEqual(rows[0][:4], ['Event Date', 'Mission', 'Mission Date', 'Event'])
+        self.assertEqual(len(rows), 1 + 2 * 2 * 3)
+        self.assertEqual(rows[1][:5], ['2024-01-01 12:00', 'Mission 0', '2024-01-01', 'Contact 0-0', 'combat'])
+        self.assertEqual(rows[-1][3], 'Contact 1-1')
+        self.assertEqual([row[0] for row in rows[1:]], sorted(row[0] for row in rows[1:]))
+
+    def test_statements_do_not_grow_with_rows(self):
+        self.seed_campaign(self.campaign, self.library, assets=3, missions=1, events=1)
+        with count_queries(db.engine) as small:
+            self.client.get(f'/admin/campaign/{self.campaign.id}/report/download/ledger').get_data()
+        self.seed_campaign(self.campaign, self.library, assets=20, missions=5, events=3)
+        with count_queries(db.engine) as large:
+            self.client.get(f'/admin/campaign/{self.campaign.id}/report/download/ledger').get_data()
+        self.assertEqual(len(small), len(large))
+
+    def test_iter_json_matches_json_dumps(self):
+        value = {'a': [1, {'b': None}], 'c': {}, 'd': [], 'e': {'f': 'ü', 'g': [[], {}]}}
+        lazy = {'a': (x for x in [1, {'b': None}]), 'c': {}, 'd': (x for x in []),
+                'e': {'f': 'ü', 'g': (x for x in [(y for y in []), {}])}}
+        self.assertEqual(''.join(iter_json(lazy)), json.dumps(value, indent=2))
+
+    def test_final_report_json_keeps_schema(self):
+        pool = self.seed_campaign(self.campaign, self.library, assets=3, missions=2, events=2)
+        db.session.add_all([Mission(campaign_id=self.campaign.id, name='Quiet', mission_date=date(2024, 2, 1)),
+                            Log(campaign_id=self.campaign.id, action='Closed', details='done')])
+        db.session.commit()
+        response = self.client.get(f'/admin/campaign/{self.campaign.id}/report/download/json')
+        self.assertTrue(response.is_streamed)
+        text = response.get_data(as_text=True)
+        report = json.loads(text)
+        self.assertEqual(text, json.dumps(report, indent=2))
+        self.assertEqual(list(report), ['campaign', 'missions_count', 'asset_history', 'detailed_missions', 'logs'])
+        self.assertEqual(report['missions_count'], 3)
+        self.assertEqual(report['asset_history'][0], {'asset_name': pool[0].name, 'asset_type': 'Vehicle',
+                                                      'initial_quantity': 10, 'current_quantity': 10, 'net_change': 0})
+        missions = report['detailed_missions']
+        self.assertEqual([m['name'] for m in missions], ['Mission 0', 'Mission 1', 'Quiet'])
+        self.assertEqual(missions[2]['events'], [])
+        self.assertEqual(missions[0]['events'][1]['date'], '2024-01-01T13:00:00')
+        self.assertEqual(missions[0]['events'][0]['asset_changes'],
+                         [{'asset_name': asset.name, 'quantity_change': -1, 'notes': None} for asset in pool])
+        self.assertEqual([log['action'] for log in report['logs']], ['Closed'])
+
+    def test_final_report_statements_do_not_grow_with_rows(self):
+        self.seed_campaign(self.campaign, self.library, assets=3, missions=1, events=1)
+        with count_queries(db.engine) as small:
+            self.client.get(f'/admin/campaign/{self.campaign.id}/report/download/json').get_data()
+        self.seed_campaign(self.campaign, self.library, assets=20, missions=5, events=3)
+        with count_queries(db.engine) as large:
+            self.client.get(f'/admin/campaign/{self.campaign.id}/report/download/json').get_data()
+        self.assertEqual(len(small), len(large))
+
+
+class TestCampaignReportView(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.campaign, self.library = self.create_campaign()
+        self.login_as()
+
+    def test_statistics_are_aggregated(self):
+        pool = self.seed_campaign(self.campaign, self.library, assets=4, missions=3, events=2)
+        pool[1].type = 'Weapon'
+        CampaignAsset.query.filter_by(asset_id=pool[0].id).update({'current_quantity': 4})
+        Mission.query.filter_by(name='Mission 0').update({'status': 'completed'})
+        Event.query.filter_by(title='Contact 2-1').update({'event_type': 'logistics'})
+        db.session.commit()
+        stats = campaign_statistics(self.campaign.id)
+        self.assertEqual((stats['total_assets'], stats['total_initial'], stats['total_current'], stats['total_change']),
+                         (4, 40, 34, -6))
+        self.assertEqual(stats['asset_types'], {'Vehicle': {'count': 3, 'initial': 30, 'current': 24},
+                                                'Weapon': {'count': 1, 'initial': 10, 'current': 10}})
+        self.assertEqual(stats['mission_stats'], {'completed': 1, 'in_progress': 0, 'planned': 2, 'cancelled': 0, 'total': 3})
+        self.assertEqual(stats['event_types'], {'combat': 5, 'logistics': 1})
+        self.assertEqual((stats['total_events'], stats['total_asset_changes']), (6, 18))
+
+        response = self.client.get(f'/admin/campaign/{self.campaign.id}/report/view')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(pool[3].name.encode(), response.data)
+
+    def test_query_count_is_constant(self):
+        self.seed_campaign(self.campaign, self.library, assets=2, missions=1, events=1)
+        self.client.get(f'/admin/campaign/{self.campaign.id}/report/view')  # Builds the rollup
+        with count_queries(db.engine) as small:
+            self.client.get(f'/admin/campaign/{self.campaign.id}/report/view')
+        self.seed_campaign(self.campaign, self.library, assets=20, missions=6, events=4)
+        self.client.get(f'/admin/campaign/{self.campaign.id}/report/view')
+        with count_queries(db.engine) as large:
+            self.client.get(f'/admin/campaign/{self.campaign.id}/report/view')
+        self.assertEqual(len(small), len(large))
+
+
+class TestCampaignRollups(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.campaign, self.library = self.create_campaign()
+        self.pool = self.seed_campaign(self.campaign, self.library, assets=4, missions=2, events=2)
+        self.missions = Mission.query.filter_by(campaign_id=self.campaign.id).order_by(Mission.id).all()
+        self.login_as()
+        load_campaign_rollup(self.campaign.id)
+
+    def assert_rollups_current(self):
+        self.assertEqual(rebuild_rollups(self.campaign.id), [])
+        db.session.rollback()
+
+    def test_writes_keep_rollups_current(self):
+        mission = self.missions[0]
+        self.client.post('/admin/event/add', data={
+            'mission_id': mission.id, 'title': 'Resupply', 'event_type': 'logistics', 'event_date': '2024-02-01T18:00',
+            'asset_changes[0][asset_id]': self.pool[0].id, 'asset_changes[0][quantity_change]': 5,
+            'asset_changes[1][asset_id]': self.pool[3].id, 'asset_changes[1][quantity_change]': -10
+        })
+        self.assert_rollups_current()
+        event = Event.query.filter_by(title='Resupply').one()
+
+        self.client.post('/admin/asset-change/add', data={'event_id': event.id, 'asset_id': self.pool[1].id,
+                                                          'quantity_change': -8})
+        self.client.post('/admin/asset-change/delete', data={'change_id': AssetChange.query.filter_by(
+            event_id=event.id, asset_id=self.pool[0].id).one().id})
+        self.client.post('/admin/event/edit', data={'event_id': event.id, 'title': 'Ambush', 'event_type': 'combat',
+                                                    'event_date': '2024-02-01T18:00'})
+        self.assert_rollups_current()
+
+        self.client.post(f'/api/campaign/{self.campaign.id}/asset-changes/batch', json={'events': [
+            {'mission_id': self.missions[1].id, 'title': 'AAR', 'event_type': 'training', 'event_date': '2024-02-02T10:00',
+             'asset_changes': [{'asset_id': self.pool[2].id, 'quantity_change': 3}]},
+            {'event_id': event.id, 'asset_changes': [{'asset_id': self.pool[2].id, 'quantity_change': -1}]}
+        ]})
+        self.client.post('/api/update-asset-quantity', json={
+            'library_id': CampaignAsset.query.filter_by(asset_id=self.pool[1].id).one().id, 'quantity': 9})
+        self.assert_rollups_current()
+
+        rollup = load_campaign_rollup(self.campaign.id)
+        self.assertEqual((rollup.asset_count, rollup.low_stock_count, rollup.depleted_count), (4, 1, 1))
+        self.assertEqual((rollup.event_count, rollup.change_count), (6, 16))
+
+        self.client.post('/admin/event/delete', data={'event_id': event.id})
+        self.client.post('/admin/mission/delete', data={'mission_id': mission.id})
+        self.client.post('/api/remove-asset-from-campaign', json={
+            'library_id': CampaignAsset.query.filter_by(asset_id=self.pool[3].id).one().id})
+        self.assert_rollups_current()
+        self.assertEqual(event_type_counts(self.campaign.id), {'combat': 2, 'training': 1})
+
+    def test_delete_event_reverts_changes_in_one_pool_update(self):
+        mission = self.missions[0]
+        for title, changes in (('Small', [(0, -2)]), ('Large', [(0, -2), (1, -1), (2, -3), (0, -1), (1, -1)])):
+            event = Event(mission_id=mission.id, event_type='combat', title=title, event_date=datetime(2024, 2, 1, 12))
+            db.session.add(event)
+            db.session.flush()
+            for index, change in changes:
+                self.client.post('/admin/asset-change/add', data={'event_id': event.id, 'asset_id': self.pool[index].id,
+                                                                  'quantity_change': change})
+        rebuild_rollups(self.campaign.id)
+        db.session.commit()
+        counts = []
+        for title in ('Small', 'Large'):
+            event_id = Event.query.filter_by(title=title).one().id
+            with count_queries(db.engine) as statements:
+                self.client.post('/admin/event/delete', data={'event_id': event_id})
+            counts.append(len([s for s in statements if s.startswith('UPDATE campaign_asset')]))
+        self.assertEqual(counts, [1, 1])
+        self.assertEqual({ca.current_quantity for ca in CampaignAsset.query.filter_by(campaign_id=self.campaign.id)}, {10})
+        self.assert_rollups_current()
+
+    def test_mission_events_page_reads_the_rollup(self):
+        db.session.get(MissionRollup, self.missions[0].id).gains = 42
+        db.session.commit()
+        response = self.client.get(f'/admin/mission/{self.missions[0].id}/events')
+        self.assertIn(b'42', response.data)
+
+    def test_rebuild_command_reports_and_fixes_drift(self):
+        db.session.get(CampaignRollup, self.campaign.id).change_count = 99
+        db.session.commit()
+        runner = self.app.test_cli_runner()
+
+        result = runner.invoke(args=['rebuild-rollups', '--check'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn(f'Campaign {self.campaign.id}: campaign[{self.campaign.id}].change_count was 99, should be 12',
+                      result.output)
+        self.assertEqual(db.session.get(CampaignRollup, self.campaign.id).change_count, 99)
+
+        self.assertIn('1 had drifted', runner.invoke(args=['rebuild-rollups']).output)
+        self.assertEqual(db.session.get(CampaignRollup, self.campaign.id).change_count, 12)
+        result = runner.invoke(args=['rebuild-rollups', '--check'])
+        self.assertEqual((result.exit_code, '0 had drifted' in result.output), (0, True))
+
+
+class TestLedgerLockOrder(DatabaseTestCase):
+    """Every pool, ledger and rollup writer takes the campaign lock before any other write or rollup statement."""
+
+    def setUp(self):
+        super().setUp()
+        self.campaign, self.library = self.create_campaign()
+        self.pool = self.seed_campaign(self.campaign, self.library, assets=3, missions=2, events=1)
+        self.import_library(self.library, [self.campaign])
+        self.login_as()
+        load_campaign_rollup(self.campaign.id)
+
+    def assert_locks_first(self, name, request):
+        with count_queries(db.engine) as statements:
+            response = request()
+            db.session.flush()
+        if hasattr(response, 'status_code'):
+            self.assertLess(response.status_code, 400, name)
+        lock = next((i for i, statement in enumerate(statements) if CAMPAIGN_LOCK.match(statement)), None)
+        self.assertIsNotNone(lock, name)
+        guarded = [statement for statement in statements[:lock]
+                   if statement.split()[0] in ('INSERT', 'UPDATE', 'DELETE') or '_rollup' in statement]
+        self.assertEqual(guarded, [], name)
+
+    def test_writers_lock_the_campaign_first(self):
+        mission, other = Mission.query.filter_by(campaign_id=self.campaign.id).order_by(Mission.id).all()
+        event = Event.query.filter_by(mission_id=mission.id).one()
+        entry = CampaignAsset.query.filter_by(asset_id=self.pool[0].id).one()
+        asset = Asset(library_id=self.library.id, name='Late Arrival', type='Vehicle', default_quantity=2)
+        db.session.add(asset)
+        db.session.commit()
+        requests = [
+            ('add event', lambda: self.client.post('/admin/event/add', data={
+                'mission_id': mission.id, 'title': 'Resupply', 'event_type': 'logistics', 'event_date': '2024-01-01T18:00',
+                'asset_changes[0][asset_id]': self.pool[1].id, 'asset_changes[0][quantity_change]': 2})),
+            ('edit event', lambda: self.client.post('/admin/event/edit', data={
+                'event_id': event.id, 'title': 'Ambush', 'event_type': 'training', 'event_date': '2023-12-31T10:00'})),
+            ('add change', lambda: self.client.post('/admin/asset-change/add', data={
+                'event_id': event.id, 'asset_id': self.pool[2].id, 'quantity_change': -1})),
+            ('delete change', lambda: self.client.post('/admin/asset-change/delete', data={
+                'change_id': AssetChange.query.filter_by(event_id=event.id).first().id})),
+            ('batch', lambda: self.client.post(f'/api/campaign/{self.campaign.id}/asset-changes/batch', json={'events': [
+                {'event_id': event.id, 'asset_changes': [{'asset_id': self.pool[0].id, 'quantity_change': 1}]}]})),
+            ('update quantity', lambda: self.client.post('/api/update-asset-quantity', json={
+                'library_id': entry.id, 'quantity': 7})),
+            ('library sync', lambda: self.client.post(
+                f'/admin/campaign/{self.campaign.id}/sync-library/{self.library.id}')),
+            ('remove asset', lambda: self.client.post('/api/remove-asset-from-campaign', json={
+                'library_id': CampaignAsset.query.filter_by(asset_id=asset.id).one().id})),
+            ('add asset', lambda: self.client.post(f'/admin/campaign/{self.campaign.id}/add-asset', json={
+                'asset_id': asset.id, 'quantity': 3})),
+            ('delete event', lambda: self.client.post('/admin/event/delete', data={'event_id': event.id})),
+            ('delete mission', lambda: self.client.post('/admin/mission/delete', data={'mission_id': other.id})),
+        ]
+        for name, request in requests:
+            self.assert_locks_first(name, request)
+        self.assertEqual(rebuild_rollups(self.campaign.id), [])
+
+    def test_rollup_writers_insert_missing_rows_under_the_campaign_lock(self):
+        mission = Mission.query.filter_by(campaign_id=self.campaign.id).order_by(Mission.id).all()[-1]
+        MissionRollup.query.filter_by(mission_id=mission.id).delete()
+        self.assert_locks_first('record', lambda: record_ledger_changes(self.campaign.id, mission.id, 'recon', 1, [2]))
+        self.assertEqual(mission_rollup_figures(mission.id)['gains'], 2)
+        self.assert_locks_first('remove', lambda: remove_mission_from_rollups(self.campaign.id, mission.id))
+        self.assert_locks_first('rebuild', lambda: rebuild_rollups(self.campaign.id))
+
+    def test_pool_recount_nests_the_rollup_lock_under_the_campaign_lock(self):
+        self.assert_locks_first('refresh', lambda: refresh_pool_rollups(self.campaign.id))
+
+
+class TestFinalReportJobs(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reports_dir = tempfile.TemporaryDirectory()
+        self.app.config['REPORTS_DIR'] = self.reports_dir.name
+        self.campaign, self.library = self.create_campaign()
+        self.seed_campaign(self.campaign, self.library, assets=3, missions=2, events=2)
+        self.login_as()
+
+    def tearDown(self):
+        super().tearDown()
+        self.reports_dir.cleanup()
+
+    def close_campaign(self):
+        response = self.client.post('/admin/campaign/close', data={'campaign_id': self.campaign.id},
+                                    headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 202)
+        data = response.get_json()
+        self.assertEqual(report_jobs.wait(data['report_job'], timeout=10)['status'], 'done')
+        return data
+
+    def test_close_writes_compressed_final_report(self):
+        data = self.close_campaign()
+        self.assertTrue(data['report'].endswith('.json.gz'))
+        self.assertEqual(os.listdir(self.reports_dir.name), [data['report']])
+        with gzip.open(os.path.join(self.reports_dir.name, data['report']), 'rt', encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertTrue(report['campaign']['is_closed'])
+        self.assertEqual(len(report['detailed_missions']), 2)
+        self.assertEqual(report, self.client.get(f'/admin/campaign/{self.campaign.id}/report/download/json').get_json())
+
+        status = self.client.get(data['status_url']).get_json()
+        self.assertEqual((status['status'], status['campaign_id']), ('done', self.campaign.id))
+        self.assertEqual(status['download_url'], f'/admin/reports/download/{data["report"]}')
+
+    def test_uncompressed_report(self):
+        self.app.config['REPORTS_GZIP'] = False
+        data = self.close_campaign()
+        with open(os.path.join(self.reports_dir.name, data['report']), encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['missions_count'], 2)
+
+    def test_report_is_indexed_and_served_compressed(self):
+        data = self.close_campaign()
+        path = os.path.join(self.reports_dir.name, data['report'])
+        with open(path, 'rb') as f:
+            stored = f.read()
+        archive = ReportArchive.query.filter_by(filename=data['report']).one()
+        self.assertEqual((archive.campaign_id, archive.size, archive.compressed), (self.campaign.id, len(stored), True))
+        self.assertEqual(archive.sha256, hashlib.sha256(stored).hexdigest())
+        self.assertIn(data['report'].encode(), self.client.get('/admin/reports').data)
+
+        url = f'/admin/reports/download/{data["report"]}'
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn(data['report'][:-3], response.headers['Content-Disposition'])
+        self.assertEqual(response.get_data(), stored)
+        response.close()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': f'"{archive.sha256}"',
+                                                       'Accept-Encoding': 'gzip'}).status_code, 304)
+
+        response = self.client.get(url)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(), gzip.decompress(stored))
+
+    def test_index_reports_command_compresses_legacy_files(self):
+        legacy = os.path.join(self.reports_dir.name, f'campaign_{self.campaign.id}_20240101_120000.json')
+        with open(legacy, 'w') as f:
+            json.dump({'campaign': {'name': 'Operation Test'}}, f)
+        with open(os.path.join(self.reports_dir.name, 'notes.txt'), 'w') as f:
+            f.write('not a report')
+        result = self.app.test_cli_runner().invoke(args=['index-reports'])
+        self.assertIn('Indexed 1 report file(s).', result.output)
+        self.assertFalse(os.path.exists(legacy))
+        archive = ReportArchive.query.one()
+        self.assertEqual((archive.filename, archive.campaign_id), (os.path.basename(legacy) + '.gz', self.campaign.id))
+        with gzip.open(legacy + '.gz', 'rt') as f:
+            self.assertEqual(json.load(f)['campaign']['name'], 'Operation Test')
+        self.assertIn('Indexed 0 report file(s).', self.app.test_cli_runner().invoke(args=['index-reports']).output)
+
+    def test_dashboard_pages_through_the_index(self):
+        self.app.config['REPORTS_PAGE_SIZE'] = 2
+        db.session.add_all([ReportArchive(filename=f'campaign_1_{i}.json.gz', created_at=datetime(2024, 1, 1 + i),
+                                          size=1, sha256='0' * 64, compressed=True) for i in range(3)])
+        db.session.commit()
+        first = self.client.get('/admin/reports').get_data(as_text=True)
+        self.assertIn('campaign_1_2.json.gz', first)
+        self.assertNotIn('campaign_1_0.json.gz', first)
+        older = re.search(r'href="(/admin/reports\?before=[^"]+)"', first).group(1)
+        second = self.client.get(older).get_data(as_text=True)
+        self.assertIn('campaign_1_0.json.gz', second)
+        self.assertNotIn('campaign_1_1.json.gz', second)
+        self.assertNotIn('?before=', second)
+
+    def test_failed_job_is_reported(self):
+        job_id = report_jobs.submit(write_final_report, 999, os.path.join(self.reports_dir.name, 'missing.json'))
+        self.assertEqual(report_jobs.wait(job_id, timeout=10)['status'], 'failed')
+        status = self.client.get(f'/admin/reports/jobs/{job_id}').get_json()
+        self.assertEqual((status['status'], status['error']), ('failed', 'Campaign 999 not found'))
+        self.assertEqual(os.listdir(self.reports_dir.name), [])
+        self.assertEqual(self.client.get('/admin/reports/jobs/unknown').status_code, 404)
+
+
+class TestIncrementalLibrarySync(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.campaign, self.library = self.create_campaign()
+        self.pool = self.seed_campaign(self.campaign, self.library, assets=4, missions=1, events=1)
+        self.import_library(self.library, [self.campaign], synced_at=datetime.utcnow())
+        self.login_as()
+
+    def test_only_assets_changed_since_watermark_are_considered(self):
+        with count_queries(db.engine) as statements:
+            result = sync_library_to_campaigns(self.library.id, dry_run=True)
+        self.assertEqual(result['plan'][0]['updated'], [])
+        self.assertFalse(any('FROM campaign_asset' in statement for statement in statements))
+
+        self.pool[3].name = 'Renamed'
+        self.pool[2].default_quantity = 15
+        db.session.commit()
+        plan = sync_library_to_campaigns(self.library.id, dry_run=True)['plan'][0]
+        self.assertEqual([entry['name'] for entry in plan['updated']], ['Renamed'])
+        self.assertEqual([(entry['previous'], entry['quantity']) for entry in plan['quantity']], [(10, 15)])
+        self.assertEqual(CampaignAsset.query.filter_by(asset_id=self.pool[2].id).one().initial_quantity, 10)
+
+        result = sync_library_to_campaigns(self.library.id)
+        self.assertEqual(result['quantities_updated'], 1)
+        entry = CampaignAsset.query.filter_by(asset_id=self.pool[2].id).one()
+        self.assertEqual((entry.initial_quantity, entry.current_quantity), (15, 15))
+        self.assertEqual(sync_library_to_campaigns(self.library.id, dry_run=True)['plan'][0]['quantity'], [])
+
+    def test_watermark_is_the_newest_edit_the_sync_saw(self):
+        self.pool[3].name = 'Renamed'
+        db.session.commit()
+        seen = db.session.get(Asset, self.pool[3].id).updated_at
+        sync_library_to_campaigns(self.library.id)
+        self.assertEqual(CampaignLibraryImport.query.one().last_synced_at, seen)
+
+        # An edit stamped before the sync ran but committed after it planned is picked up next time
+        late = db.session.get(Asset, self.pool[2].id)
+        late.name = 'Late'
+        late.updated_at = seen + timedelta(microseconds=1)
+        db.session.commit()
+        plan = sync_library_to_campaigns(self.library.id, dry_run=True)['plan'][0]
+        self.assertEqual([entry['name'] for entry in plan['updated']], ['Late'])
+
+    def test_custom_pool_quantity_survives_unrelated_edits(self):
+        entry = CampaignAsset.query.filter_by(asset_id=self.pool[1].id).one()
+        entry.initial_quantity = entry.current_quantity = 25
+        db.session.commit()
+        asset = self.pool[1]
+        self.client.post(f'/admin/libraries/{self.library.id}/edit-asset/{asset.id}', data={
+            'name': 'Renamed', 'type': asset.type, 'default_quantity': asset.default_quantity, 'show_in_public': ''})
+        self.assertEqual(db.session.get(Asset, asset.id).name, 'Renamed')
+        entry = CampaignAsset.query.filter_by(asset_id=asset.id).one()
+        self.assertEqual((entry.initial_quantity, entry.current_quantity), (25, 25))
+
+        self.client.post(f'/admin/libraries/{self.library.id}/edit-asset/{asset.id}', data={
+            'name': 'Renamed', 'type': asset.type, 'default_quantity': 30})
+        entry = CampaignAsset.query.filter_by(asset_id=asset.id).one()
+        self.assertEqual((entry.initial_quantity, entry.current_quantity), (30, 30))
+
+    def test_retired_assets_follow_removal_policy(self):
+        # pool[0] and pool[1] have ledger history from the seeded event, pool[3] does not
+        self.client.post(f'/admin/campaign/{self.campaign.id}/library/{self.library.id}/removal-policy',
+                         data={'removal_policy': 'remove'})
+        for asset in (self.pool[1], self.pool[3]):
+            self.client.post(f'/admin/libraries/{self.library.id}/delete-asset', data={'asset_id': asset.id})
+
+        remaining = {ca.asset_id for ca in CampaignAsset.query.filter_by(campaign_id=self.campaign.id)}
+        self.assertIn(self.pool[1].id, remaining)
+        self.assertNotIn(self.pool[3].id, remaining)
+        self.assertIsNotNone(db.session.get(Asset, self.pool[3].id).retired_at)
+
+        # A manual sync does not bring the retired asset back
+        self.client.post(f'/admin/campaign/{self.campaign.id}/sync-library/{self.library.id}')
+        self.assertEqual(CampaignAsset.query.filter_by(asset_id=self.pool[3].id).count(), 0)
+
+    def test_switching_to_remove_clears_assets_already_flagged(self):
+        for asset in (self.pool[1], self.pool[3]):
+            self.client.post(f'/admin/libraries/{self.library.id}/delete-asset', data={'asset_id': asset.id})
+        self.assertEqual(CampaignAsset.query.filter_by(asset_id=self.pool[3].id).count(), 1)
+        self.assertEqual(sync_library_to_campaigns(self.library.id, dry_run=True)['assets_flagged'], 0)
+
+        self.client.post(f'/admin/campaign/{self.campaign.id}/library/{self.library.id}/removal-policy',
+                         data={'removal_policy': 'remove'})
+        result = sync_library_to_campaigns(self.library.id)
+        self.assertEqual(result['assets_removed'], 1)
+        remaining = {ca.asset_id for ca in CampaignAsset.query.filter_by(campaign_id=self.campaign.id)}
+        self.assertIn(self.pool[1].id, remaining)
+        self.assertNotIn(self.pool[3].id, remaining)
+        self.assertEqual(sync_library_to_campaigns(self.library.id, dry_run=True)['assets_removed'], 0)
+
+
+class TestConcurrentQuantityUpdates(unittest.TestCase):
+    """Runs against a file database so several request threads share one store."""
+
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.app = create_app('testing')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.db_path
+        self.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'timeout': 30, 'check_same_thread': False}
+        }
+        self.app.extensions.pop('sqlalchemy')
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+            campaign = Campaign(name='Operation Test', is_active=True)
+            library = AssetLibrary(name='Library')
+            db.session.add_all([campaign, library])
+            db.session.flush()
+            asset = Asset(library_id=library.id, name='Rifle', type='Weapon')
+            mission = Mission(campaign_id=campaign.id, name='Mission', mission_date=date(2024, 1, 1))
+            user = User(username='manager', is_manager=True)
+            user.set_password('password')
+            db.session.add_all([asset, mission, user])
+            db.session.flush()
+            db.session.add(CampaignAsset(campaign_id=campaign.id, asset_id=asset.id, library_id=library.id,
+                                         initial_quantity=1000, current_quantity=1000))
+            event = Event(mission_id=mission.id, event_type='combat', title='Contact',
+                          event_date=datetime(2024, 1, 1, 12))
+            db.session.add(event)
+            db.session.commit()
+            self.ids = {'campaign': campaign.id, 'asset': asset.id, 'event': event.id, 'user': user.id}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        os.remove(self.db_path)
+
+    def current_quantity(self):
+        with self.app.app_context():
+            return CampaignAsset.query.filter_by(asset_id=self.ids['asset']).one().current_quantity
+
+    def test_parallel_asset_changes_are_not_lost(self):
+        threads, per_thread = 4, 25
+        failures = []
+        with self.app.app_context():
+            load_campaign_rollup(self.ids['campaign'])
+
+        def worker():
+            client = self.app.test_client()
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(self.ids['user'])
+                sess['_fresh'] = True
+            for _ in range(per_thread):
+                response = client.post('/admin/asset-change/add', data={
+                    'event_id': self.ids['event'], 'asset_id': self.ids['asset'], 'quantity_change': -1
+                })
+                if response.status_code != 302:
+                    failures.append(response.status_code)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(failures, [])
+        with self.app.app_context():
+            self.assertEqual(AssetChange.query.count(), threads * per_thread)
+        self.assertEqual(self.current_quantity(), 1000 - threads * per_thread)
+        with self.app.app_context():
+            self.assertEqual(rebuild_rollups(self.ids['campaign']), [])
+            self.assertEqual(load_campaign_rollup(self.ids['campaign']).total_current, 1000 - threads * per_thread)
+
+    def test_adjustment_ignores_stale_reads_and_clamps_at_zero(self):
+        with self.app.app_context():
+            stale = CampaignAsset.query.filter_by(asset_id=self.ids['asset']).one()
+            self.assertEqual(stale.current_quantity, 1000)
+            adjust_pool_quantity(self.ids['campaign'], self.ids['asset'], -400)
+            adjust_pool_quantity(self.ids['campaign'], self.ids['asset'], -400)
+            db.session.commit()
+        self.assertEqual(self.current_quantity(), 200)
+        with self.app.app_context():
+            adjust_pool_quantity(self.ids['campaign'], self.ids['asset'], -500)
+            db.session.commit()
+        self.assertEqual(self.current_quantity(), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file